@@ -1,6 +1,13 @@
 import database as db
 from datetime import datetime, timedelta
+import argparse
+import itertools
 import random
+import time
+
+# Generated timestamps and appointment dates count back (and forward)
+# from this moment, so the same seed always gives the same rows
+ANCHOR = datetime(2025, 1, 1)
 
 def add_sample_data():
     """Add sample patients, consultations, appointments, and orders for testing"""
@@ -215,36 +222,15 @@ def add_sample_data():
     print("SAMPLE DATA ADDED SUCCESSFULLY!")
     print("=" * 80)
 
-    conn = db.get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute('SELECT COUNT(*) as count FROM users')
-    total_patients = cursor.fetchone()['count']
-
-    cursor.execute('SELECT COUNT(*) as count FROM doctors')
-    total_doctors = cursor.fetchone()['count']
-
-    cursor.execute('SELECT COUNT(*) as count FROM consultations')
-    total_consultations = cursor.fetchone()['count']
-
-    cursor.execute('SELECT COUNT(*) as count FROM appointments')
-    total_appointments = cursor.fetchone()['count']
-
-    cursor.execute('SELECT COUNT(*) as count FROM medicine_orders')
-    total_orders = cursor.fetchone()['count']
-
-    cursor.execute('SELECT COUNT(*) as count FROM contact_messages')
-    total_messages = cursor.fetchone()['count']
-
-    conn.close()
-
+    # Totals come from the trigger-maintained stats counters
+    counts = db.get_table_counts()
     print(f"\nDatabase Statistics:")
-    print(f"  - Patients: {total_patients}")
-    print(f"  - Doctors: {total_doctors}")
-    print(f"  - Consultations: {total_consultations}")
-    print(f"  - Appointments: {total_appointments}")
-    print(f"  - Medicine Orders: {total_orders}")
-    print(f"  - Contact Messages: {total_messages}")
+    print(f"  - Patients: {counts['users']}")
+    print(f"  - Doctors: {counts['doctors']}")
+    print(f"  - Consultations: {counts['consultations']}")
+    print(f"  - Appointments: {counts['appointments']}")
+    print(f"  - Medicine Orders: {counts['medicine_orders']}")
+    print(f"  - Contact Messages: {counts['contact_messages']}")
 
     print("\n" + "=" * 80)
     print("LOGIN CREDENTIALS")
@@ -265,5 +251,211 @@ def add_sample_data():
     print("You can now login with any of the above credentials!")
     print("=" * 80)
 
+# Synthetic data generator for load testing
+
+SPECIALIZATIONS = [
+    ('General Physician', 'MBBS, MD'), ('Pediatrician', 'MBBS, DCH'),
+    ('Cardiologist', 'MBBS, DM (Cardiology)'), ('Dermatologist', 'MBBS, MD (Dermatology)'),
+    ('Orthopedic', 'MBBS, MS (Ortho)'), ('Gynecologist', 'MBBS, MS (OBG)'),
+    ('Neurologist', 'MBBS, DM (Neurology)'), ('Psychiatrist', 'MBBS, MD (Psychiatry)'),
+    ('ENT Specialist', 'MBBS, MS (ENT)'), ('Ophthalmologist', 'MBBS, MS (Ophthalmology)'),
+    ('Dentist', 'BDS, MDS'),
+]
+FIRST_NAMES = ['Aarav', 'Vivaan', 'Aditya', 'Ishaan', 'Rohan', 'Kabir', 'Arjun', 'Sai', 'Ananya', 'Diya',
+               'Isha', 'Kavya', 'Meera', 'Priya', 'Saanvi', 'Neha', 'John', 'Sarah', 'David', 'Lisa']
+LAST_NAMES = ['Sharma', 'Kumar', 'Singh', 'Patel', 'Reddy', 'Nair', 'Iyer', 'Gupta', 'Verma', 'Shah',
+              'Das', 'Rao', 'Mehta', 'Joshi', 'Smith', 'Brown', 'Lee', 'Jones']
+CITIES = [('Mumbai', '400001'), ('Delhi', '110001'), ('Bangalore', '560001'), ('Hyderabad', '500033'),
+          ('Chennai', '600017'), ('Pune', '411001'), ('Kolkata', '700091'), ('Ahmedabad', '380001'),
+          ('Jaipur', '302001'), ('Lucknow', '226001')]
+CONSULTATION_STATUSES = (['completed', 'in-progress', 'pending'], [60, 15, 25])
+APPOINTMENT_STATUSES = (['pending', 'completed', 'cancelled'], [45, 45, 10])
+ORDER_STATUSES = (['pending', 'completed'], [30, 70])
+TIMES = ['09:00', '09:30', '10:00', '10:30', '11:00', '11:30', '12:00', '14:00', '14:30',
+         '15:00', '15:30', '16:00', '16:30', '17:00']
+
+BATCH_SIZE = 10000       # rows per executemany() call
+COMMIT_EVERY = 200000    # rows per transaction
+
+def _next_id(conn, table):
+    row = conn.execute(f'''
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = '{table}'), 0),
+                   COALESCE((SELECT MAX(id) FROM {table}), 0))
+    ''').fetchone()
+    return row[0] + 1
+
+def _bulk_insert(conn, table, columns, rows):
+    """Insert rows from an iterable with executemany() in large transactions"""
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    count = 0
+    since_commit = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(query, batch)
+            count += len(batch)
+            since_commit += len(batch)
+            batch.clear()
+            if since_commit >= COMMIT_EVERY:
+                conn.commit()
+                since_commit = 0
+    if batch:
+        conn.executemany(query, batch)
+        count += len(batch)
+    conn.commit()
+    return count
+
+def _timestamp(rng, now, days):
+    return (now - timedelta(seconds=rng.randrange(days * 86400))).strftime('%Y-%m-%d %H:%M:%S')
+
+def _per_patient(rng, mean):
+    # Exponential counts: most patients have a few records, a long tail has many
+    return int(rng.expovariate(1 / mean)) if mean > 0 else 0
+
+def generate_dataset(patients, doctors, seed=42, consultations_per_patient=3.0,
+                     appointments_per_patient=2.0, orders_per_patient=1.0, days=365, anchor=ANCHOR):
+    """Append a reproducible synthetic dataset to the database.
+
+    Records span the days before anchor (appointments up to 30 days
+    after it). Doctor popularity follows a Zipf-like curve, so a few
+    physicians carry most of the load, as they do in production.
+    Returns row counts per table.
+    """
+    if doctors < 1:
+        raise ValueError('At least one doctor is needed')
+    if days < 1:
+        raise ValueError('History must span at least one day')
+    rng = random.Random(seed)
+    now = anchor
+    conn = db.get_db_connection()
+    counts = {}
+
+    first_doctor = _next_id(conn, 'doctors')
+    doctor_ids = list(range(first_doctor, first_doctor + doctors))
+    doctor_weights = list(itertools.accumulate(1 / (rank + 1) ** 0.8 for rank in range(doctors)))
+
+    def doctor_rows():
+        for doctor_id in doctor_ids:
+            specialization, qualification = rng.choice(SPECIALIZATIONS)
+            name = f"Dr. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            yield (doctor_id, f'doctor_{doctor_id}', 'doctor123', name, specialization,
+                   f'doctor_{doctor_id}@healthconnect.com', f'+91 9{rng.randrange(10**9):09d}',
+                   rng.randint(1, 35), qualification, float(rng.randrange(300, 1500, 50)),
+                   1 if rng.random() < 0.95 else 0, _timestamp(rng, now, days * 2))
+    start = time.time()
+    counts['doctors'] = _bulk_insert(conn, 'doctors', [
+        'id', 'username', 'password', 'full_name', 'specialization', 'email', 'phone',
+        'experience_years', 'qualification', 'consultation_fee', 'available', 'created_at',
+    ], doctor_rows())
+    print(f"   [OK] doctors: {counts['doctors']} rows in {time.time() - start:.1f}s")
+
+    first_patient = _next_id(conn, 'users')
+    patient_ids = range(first_patient, first_patient + patients)
+
+    def patient_rows():
+        for user_id in patient_ids:
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            age = rng.randint(1, 90)
+            gender = rng.choice(['Male', 'Female'])
+            yield (user_id, f'patient_{user_id}', 'patient123', f'patient_{user_id}@email.com',
+                   f'+91 8{rng.randrange(10**9):09d}', name, age, gender, _timestamp(rng, now, days))
+    start = time.time()
+    counts['users'] = _bulk_insert(conn, 'users', [
+        'id', 'username', 'password', 'email', 'phone', 'full_name', 'age', 'gender', 'created_at',
+    ], patient_rows())
+    print(f"   [OK] users: {counts['users']} rows in {time.time() - start:.1f}s")
+
+    def pick_doctor():
+        return rng.choices(doctor_ids, cum_weights=doctor_weights)[0] if doctor_ids else None
+
+    def consultation_rows():
+        for user_id in patient_ids:
+            for _ in range(_per_patient(rng, consultations_per_patient)):
+                status = rng.choices(*CONSULTATION_STATUSES)[0]
+                city, _ = rng.choice(CITIES)
+                prescription = 'Tab. Paracetamol 500mg - twice daily for 5 days' if status == 'completed' else None
+                yield (user_id, pick_doctor(), f'Patient {user_id}', rng.randint(1, 90),
+                       rng.choice(['Male', 'Female']), city, rng.choice(['Prescription', 'Appointment']),
+                       'Generated consultation request', status, prescription, _timestamp(rng, now, days))
+    start = time.time()
+    counts['consultations'] = _bulk_insert(conn, 'consultations', [
+        'user_id', 'doctor_id', 'fullname', 'age', 'gender', 'city', 'service_type', 'problem',
+        'status', 'prescription', 'created_at',
+    ], consultation_rows())
+    print(f"   [OK] consultations: {counts['consultations']} rows in {time.time() - start:.1f}s")
+
+    def appointment_rows():
+        for user_id in patient_ids:
+            for _ in range(_per_patient(rng, appointments_per_patient)):
+                day = now + timedelta(days=rng.randint(-days, 30))
+                yield (user_id, pick_doctor(), day.strftime('%Y-%m-%d'), rng.choice(TIMES),
+                       'Generated appointment', rng.choices(*APPOINTMENT_STATUSES)[0],
+                       _timestamp(rng, now, days))
+    start = time.time()
+    counts['appointments'] = _bulk_insert(conn, 'appointments', [
+        'user_id', 'doctor_id', 'appointment_date', 'appointment_time', 'reason', 'status', 'created_at',
+    ], appointment_rows())
+    print(f"   [OK] appointments: {counts['appointments']} rows in {time.time() - start:.1f}s")
+
+    def order_rows():
+        for user_id in patient_ids:
+            for _ in range(_per_patient(rng, orders_per_patient)):
+                town, zipcode = rng.choice(CITIES)
+                yield (user_id, f'Patient {user_id}', f'+91 8{rng.randrange(10**9):09d}', zipcode, town,
+                       'Near Main Road', None, rng.choices(*ORDER_STATUSES)[0], _timestamp(rng, now, days))
+    start = time.time()
+    counts['medicine_orders'] = _bulk_insert(conn, 'medicine_orders', [
+        'user_id', 'fullname', 'phone', 'zipcode', 'town', 'landmark', 'prescription_file',
+        'status', 'created_at',
+    ], order_rows())
+    print(f"   [OK] medicine_orders: {counts['medicine_orders']} rows in {time.time() - start:.1f}s")
+
+    conn.execute('ANALYZE')
+    conn.close()
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Add demo data, or generate a large synthetic dataset with --patients')
+    parser.add_argument('--database', default=db.DATABASE, help='SQLite database file')
+    parser.add_argument('--patients', type=int, help='generate this many synthetic patients')
+    parser.add_argument('--doctors', type=int, default=200, help='synthetic doctors to generate')
+    parser.add_argument('--seed', type=int, default=42, help='random seed (same seed, same data)')
+    parser.add_argument('--consultations-per-patient', type=float, default=3.0, help='mean per patient')
+    parser.add_argument('--appointments-per-patient', type=float, default=2.0, help='mean per patient')
+    parser.add_argument('--orders-per-patient', type=float, default=1.0, help='mean per patient')
+    parser.add_argument('--days', type=int, default=365, help='history length in days')
+    parser.add_argument('--anchor', default=ANCHOR.date().isoformat(), metavar='YYYY-MM-DD',
+                        help=f"date the history ends on, or 'today' (default {ANCHOR.date().isoformat()})")
+    args = parser.parse_args(argv)
+    if args.patients is not None and args.patients < 0:
+        parser.error('--patients must not be negative')
+    if args.doctors < 1:
+        parser.error('--doctors must be at least 1')
+    if args.days < 1:
+        parser.error('--days must be at least 1')
+    try:
+        anchor = datetime.now() if args.anchor == 'today' else datetime.fromisoformat(args.anchor)
+    except ValueError:
+        parser.error(f"--anchor must be YYYY-MM-DD or 'today', not {args.anchor!r}")
+
+    db.DATABASE = args.database
+    db.init_db()
+    if args.patients is None:
+        add_sample_data()
+        return
+
+    print("=" * 80)
+    print(f"GENERATING SYNTHETIC DATA (patients={args.patients}, doctors={args.doctors}, seed={args.seed})")
+    print("=" * 80)
+    start = time.time()
+    counts = generate_dataset(
+        args.patients, args.doctors, args.seed,
+        args.consultations_per_patient, args.appointments_per_patient,
+        args.orders_per_patient, args.days, anchor,
+    )
+    print(f"\nGenerated {sum(counts.values())} rows in {time.time() - start:.1f}s")
+
 if __name__ == '__main__':
-    add_sample_data()
+    main()
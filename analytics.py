@@ -0,0 +1,274 @@
+import argparse
+import logging
+import os
+import threading
+
+import database as db
+
+# Seconds between incremental refreshes of the rollup tables
+REFRESH_INTERVAL = float(os.environ.get('HEALTHCONNECT_ANALYTICS_REFRESH', 300))
+
+# Source rows folded into the rollups per transaction, so a refresh
+# never holds the write lock for long
+REFRESH_BATCH = 5000
+
+# Each source table is folded into its rollup by id: rows above the
+# high-water mark in rollup_state are new since the last refresh
+SOURCES = {
+    'consultations': '''
+        INSERT INTO rollup_consultations_daily (day, doctor_id, consultations)
+        SELECT date(created_at), doctor_id, COUNT(*) FROM consultations
+        WHERE id > ? AND id <= ? AND doctor_id IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT (day, doctor_id) DO UPDATE SET consultations = consultations + excluded.consultations
+    ''',
+    'appointments': '''
+        INSERT INTO rollup_appointments_daily (day, specialization, appointments)
+        SELECT a.appointment_date, COALESCE(d.specialization, 'Unknown'), COUNT(*)
+        FROM appointments a LEFT JOIN doctors d ON d.id = a.doctor_id
+        WHERE a.id > ? AND a.id <= ?
+        GROUP BY 1, 2
+        ON CONFLICT (day, specialization) DO UPDATE SET appointments = appointments + excluded.appointments
+    ''',
+    'medicine_orders': '''
+        INSERT INTO rollup_orders_daily (day, town, zipcode, orders)
+        SELECT date(created_at), town, zipcode, COUNT(*) FROM medicine_orders
+        WHERE id > ? AND id <= ?
+        GROUP BY 1, 2, 3
+        ON CONFLICT (day, town, zipcode) DO UPDATE SET orders = orders + excluded.orders
+    ''',
+}
+
+# Queues whose age is tracked: table and the status of rows still waiting
+QUEUES = {
+    'consultations': 'pending',
+    'appointments': 'pending',
+    'medicine_orders': 'pending',
+    'contact_messages': 'unread',
+}
+
+# Pending age buckets: (upper bound in days or None, label)
+AGE_BUCKETS = [
+    (1, 'Under 1 day'),
+    (3, '1-3 days'),
+    (7, '3-7 days'),
+    (30, '1-4 weeks'),
+    (None, 'Over 4 weeks'),
+]
+
+ROLLUP_TABLES = ('rollup_consultations_daily', 'rollup_appointments_daily', 'rollup_orders_daily',
+                 'rollup_pending', 'rollup_state')
+
+logger = logging.getLogger(__name__)
+
+_refresh_lock = threading.RLock()
+_thread = None
+_stop = threading.Event()
+
+def _bucket_expression():
+    cases = ' '.join(f'WHEN age < {days} THEN {i}' for i, (days, _) in enumerate(AGE_BUCKETS) if days)
+    return f'CASE {cases} ELSE {len(AGE_BUCKETS) - 1} END'
+
+@db.retry_on_locked
+def _fold(conn, source, statement):
+    """Fold the next batch of new rows of one source; returns how many ids were covered"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT last_id FROM rollup_state WHERE source = ?', (source,)).fetchone()
+        last_id = row['last_id'] if row else 0
+        max_id = conn.execute(f'SELECT MAX(id) FROM {source}').fetchone()[0] or 0
+        upto = min(max_id, last_id + REFRESH_BATCH)
+        if upto > last_id:
+            conn.execute(statement, (last_id, upto))
+        conn.execute('''
+            INSERT INTO rollup_state (source, last_id, refreshed_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (source) DO UPDATE SET last_id = excluded.last_id, refreshed_at = excluded.refreshed_at
+        ''', (source, upto))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return upto - last_id
+
+@db.retry_on_locked
+def _snapshot_pending(conn):
+    """Replace the pending age buckets, read through the partial pending indexes"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM rollup_pending')
+        for table, status in QUEUES.items():
+            conn.execute(f'''
+                INSERT INTO rollup_pending (source, bucket, items, oldest)
+                SELECT ?, {_bucket_expression()} AS bucket, COUNT(*), MIN(created_at)
+                FROM (SELECT created_at, julianday('now') - julianday(created_at) AS age
+                      FROM {table} WHERE status = '{status}')
+                GROUP BY bucket
+            ''', (table,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def refresh():
+    """Fold rows added since the last refresh into the daily rollups.
+
+    Only rows above each source's high-water mark are read, by primary
+    key, so a refresh costs the same however large the tables grow.
+    Returns the number of new rows per source.
+    """
+    with _refresh_lock:
+        conn = db.get_db_connection()
+        try:
+            folded = {}
+            for source, statement in SOURCES.items():
+                folded[source] = 0
+                while True:
+                    count = _fold(conn, source, statement)
+                    folded[source] += count
+                    if count < REFRESH_BATCH:
+                        break
+            _snapshot_pending(conn)
+        finally:
+            conn.close()
+    return folded
+
+def rebuild():
+    """Empty the rollups and fold every row again (a full scan; run off-peak).
+
+    Needed after rows are deleted or their doctor, date or address
+    changes, which incremental refreshes do not see.
+    """
+    with _refresh_lock:
+        conn = db.get_db_connection()
+        conn.execute('BEGIN IMMEDIATE')
+        for table in ROLLUP_TABLES:
+            conn.execute(f'DELETE FROM {table}')
+        conn.commit()
+        conn.close()
+        return refresh()
+
+def _run_refresher():
+    while not _stop.wait(REFRESH_INTERVAL):
+        try:
+            refresh()
+        except Exception:
+            logger.exception("Analytics refresh failed")
+
+def start():
+    """Refresh once in the background, then every REFRESH_INTERVAL seconds (idempotent)"""
+    global _thread
+    if _thread is not None:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_refresh_then_run, name='analytics-refresher', daemon=True)
+    _thread.start()
+
+def _refresh_then_run():
+    try:
+        refresh()
+    except Exception:
+        logger.exception("Analytics refresh failed")
+    _run_refresher()
+
+def stop(timeout=5.0):
+    """Stop the refresher thread"""
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout)
+    _thread = None
+
+def get_last_refresh():
+    """Timestamp of the oldest source refresh, or None if never refreshed"""
+    conn = db.get_db_connection()
+    row = conn.execute('SELECT MIN(refreshed_at) AS refreshed_at FROM rollup_state').fetchone()
+    conn.close()
+    return row['refreshed_at']
+
+def get_consultations_per_doctor(since, until, limit=200):
+    """Consultations per doctor per day between two dates, newest day first"""
+    conn = db.get_db_connection()
+    rows = conn.execute('''
+        SELECT r.day, r.doctor_id, COALESCE(d.full_name, 'Doctor #' || r.doctor_id) AS doctor_name,
+               r.consultations
+        FROM rollup_consultations_daily r LEFT JOIN doctors d ON d.id = r.doctor_id
+        WHERE r.day BETWEEN ? AND ?
+        ORDER BY r.day DESC, r.consultations DESC
+        LIMIT ?
+    ''', (since, until, limit)).fetchall()
+    conn.close()
+    return rows
+
+def get_doctor_totals(since, until, limit=20):
+    """Busiest doctors by consultations between two dates"""
+    conn = db.get_db_connection()
+    rows = conn.execute('''
+        SELECT r.doctor_id, COALESCE(d.full_name, 'Doctor #' || r.doctor_id) AS doctor_name,
+               d.specialization, SUM(r.consultations) AS consultations, COUNT(*) AS active_days
+        FROM rollup_consultations_daily r LEFT JOIN doctors d ON d.id = r.doctor_id
+        WHERE r.day BETWEEN ? AND ?
+        GROUP BY r.doctor_id
+        ORDER BY consultations DESC
+        LIMIT ?
+    ''', (since, until, limit)).fetchall()
+    conn.close()
+    return rows
+
+def get_appointments_by_specialization(since, until):
+    """Appointments scheduled between two dates per specialization"""
+    conn = db.get_db_connection()
+    rows = conn.execute('''
+        SELECT specialization, SUM(appointments) AS appointments, MAX(appointments) AS busiest_day
+        FROM rollup_appointments_daily
+        WHERE day BETWEEN ? AND ?
+        GROUP BY specialization
+        ORDER BY appointments DESC
+    ''', (since, until)).fetchall()
+    conn.close()
+    return rows
+
+def get_orders_by_area(since, until, limit=20):
+    """Medicine orders placed between two dates per town and zipcode"""
+    conn = db.get_db_connection()
+    rows = conn.execute('''
+        SELECT town, zipcode, SUM(orders) AS orders
+        FROM rollup_orders_daily
+        WHERE day BETWEEN ? AND ?
+        GROUP BY town, zipcode
+        ORDER BY orders DESC
+        LIMIT ?
+    ''', (since, until, limit)).fetchall()
+    conn.close()
+    return rows
+
+def get_pending_ages():
+    """Waiting items per queue: {queue: {'buckets': [(label, items)], 'total': n, 'oldest': ts}}"""
+    conn = db.get_db_connection()
+    rows = conn.execute('SELECT source, bucket, items, oldest FROM rollup_pending').fetchall()
+    conn.close()
+    found = {(row['source'], row['bucket']): row for row in rows}
+    ages = {}
+    for source in QUEUES:
+        present = [row for (name, _), row in found.items() if name == source]
+        ages[source] = {
+            'buckets': [(label, found[(source, bucket)]['items'] if (source, bucket) in found else 0)
+                        for bucket, (_, label) in enumerate(AGE_BUCKETS)],
+            'total': sum(row['items'] for row in present),
+            'oldest': min((row['oldest'] for row in present if row['oldest']), default=None),
+        }
+    return ages
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Refresh the HealthConnect analytics rollups')
+    parser.add_argument('--database', default=db.DATABASE, help='SQLite database file')
+    parser.add_argument('--rebuild', action='store_true', help='recompute every rollup from scratch (full scan)')
+    args = parser.parse_args(argv)
+
+    db.DATABASE = args.database
+    db.init_db()
+    folded = rebuild() if args.rebuild else refresh()
+    for source, count in folded.items():
+        print(f"{source}: {count} new rows")
+
+if __name__ == '__main__':
+    main()
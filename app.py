@@ -1,20 +1,114 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, Request, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, abort, g, before_render_template, template_rendered
+from flask.sessions import SecureCookieSessionInterface
+import datetime
+import hmac
+import multiprocessing
 import os
-from datetime import datetime
+import time
 from functools import wraps
+import analytics
+import auth
 import database as db
+import jobs
+import metrics
+import prescriptions
+import sessions
+import slots
+import slow_queries
+import storage
+
+class UploadRequest(Request):
+    """Request that streams file uploads to disk while hashing them"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return storage.HashingTempFile(os.path.join(app.config['UPLOAD_FOLDER'], storage.TEMP_DIR))
+
+class TimedSessionMixin:
+    """Records how long loading and saving the session take"""
+
+    def open_session(self, app, request):
+        start = time.perf_counter()
+        try:
+            return super().open_session(app, request)
+        finally:
+            g.session_seconds = time.perf_counter() - start
+
+    def save_session(self, app, session, response):
+        start = time.perf_counter()
+        super().save_session(app, session, response)
+        if request.url_rule is not None:
+            metrics.request_phase_seconds.inc(time.perf_counter() - start, request.url_rule.rule, 'session')
+
+class TimedCookieSessionInterface(TimedSessionMixin, SecureCookieSessionInterface):
+    """Flask's signed-cookie sessions, timed"""
+
+class TimedServerSideSessionInterface(TimedSessionMixin, sessions.ServerSideSessionInterface):
+    """Server-side sessions (HEALTHCONNECT_SESSION_BACKEND), timed"""
 
 app = Flask(__name__)
+app.request_class = UploadRequest
+session_store = sessions.make_store()
+if session_store is not None:
+    app.session_interface = TimedServerSideSessionInterface(session_store)
+else:
+    app.session_interface = TimedCookieSessionInterface()
 app.secret_key = 'your-secret-key-here-change-in-production'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# Let the front-end server (Apache mod_xsendfile, etc.) send prescription files
+app.config['USE_X_SENDFILE'] = os.environ.get('HEALTHCONNECT_X_SENDFILE') == '1'
+# Content-addressed files never change, so clients may keep them for a year
+app.config['PRESCRIPTION_MAX_AGE'] = 365 * 24 * 60 * 60
+# Add a Server-Timing header (sql, render, session, app) to every response
+app.config['SERVER_TIMING'] = os.environ.get('HEALTHCONNECT_SERVER_TIMING') == '1'
+# Bearer token that lets a Prometheus scraper read /metrics (unset: admin only)
+app.config['METRICS_TOKEN'] = os.environ.get('HEALTHCONNECT_METRICS_TOKEN')
+
+# Log slow statements to the slow_queries table
+slow_queries.install()
 
 # Create uploads folder if it doesn't exist
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
-# Initialize database
-db.init_db()
+# Initialize the database, except in the PDF worker processes that
+# re-import this module
+if multiprocessing.parent_process() is None:
+    db.init_db()
+
+# Request timing and SQL instrumentation
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.render_seconds = 0.0
+    db.start_query_tracking()
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.render_start = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def stop_render_timer(sender, template, context, **extra):
+    g.render_seconds += time.perf_counter() - g.pop('render_start', time.perf_counter())
+
+@app.after_request
+def record_request_metrics(response):
+    sql = db.stop_query_tracking()
+    if 'request_start' not in g:
+        return response
+    seconds = time.perf_counter() - g.request_start
+    session_seconds = g.get('session_seconds', 0.0)
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.observe_request(request.method, route, response.status_code, seconds,
+                            sql, g.render_seconds, session_seconds)
+    if app.config['SERVER_TIMING']:
+        response.headers['Server-Timing'] = metrics.server_timing(
+            seconds, sql, g.render_seconds, session_seconds)
+    return response
+
+@app.teardown_request
+def stop_request_tracking(error=None):
+    db.stop_query_tracking()
 
 # Decorator for login required
 def login_required(f):
@@ -36,6 +130,26 @@ def doctor_login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Decorator for admin login required
+def admin_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session.get('user_type') != 'admin':
+            flash('Please login as admin to access this page.', 'error')
+            return redirect(url_for('login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+# Prometheus metrics, for the admin session or a scraper that sends
+# "Authorization: Bearer <HEALTHCONNECT_METRICS_TOKEN>"
+@app.route('/metrics')
+def prometheus_metrics():
+    token = app.config['METRICS_TOKEN']
+    scraper = token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not scraper and session.get('user_type') != 'admin':
+        abort(403)
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 # Home page
 @app.route('/')
 @app.route('/home')
@@ -57,27 +171,39 @@ def doctor():
         age = request.form.get('age')
         gender = request.form.get('gender')
         city = request.form.get('city')
-        doctor_name = request.form.get('doctor')
+        doctor_ref = request.form.get('doctor')
         service = request.form.get('service')
         problem = request.form.get('problem')
 
-        # Find doctor ID by name
-        doctor_id = None
-        for doc in doctors:
-            if doc['full_name'] in doctor_name:
-                doctor_id = doc['id']
-                break
+        # Resolve the doctor by ID (or by name for older forms)
+        selected_doctor = db.find_doctor(doctor_ref)
+        doctor_id = selected_doctor['id'] if selected_doctor else None
 
         # Create consultation
         consultation_id = db.create_consultation(
             user_id, doctor_id, fullname, age, gender, city, service, problem
         )
+        jobs.enqueue('consultation_created', {'consultation_id': consultation_id})
 
         flash('Consultation request submitted successfully!', 'success')
         return redirect(url_for('user_dashboard'))
 
     return render_template('doctor.html', doctors=doctors)
 
+# Doctor search API
+@app.route('/api/doctors/search')
+def search_doctors():
+    page = db.search_doctors(
+        text=request.args.get('q'),
+        specialization=request.args.get('specialization'),
+        min_fee=request.args.get('min_fee', type=float),
+        max_fee=request.args.get('max_fee', type=float),
+        min_experience=request.args.get('min_experience', type=int),
+        limit=db.clamp_page_size(request.args.get('per_page')),
+        cursor=request.args.get('cursor'),
+    )
+    return jsonify(doctors=[dict(doc) for doc in page.rows], next_cursor=page.next_cursor)
+
 # Order Medicine page
 @app.route('/order', methods=['GET', 'POST'])
 @login_required
@@ -85,14 +211,19 @@ def order():
     if request.method == 'POST':
         user_id = session.get('user_id')
 
-        # Handle file upload
+        # Handle file upload (stored once per distinct content)
         prescription_file = request.files.get('prescription')
         filename = None
+        original_name = None
 
         if prescription_file and prescription_file.filename:
-            filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{prescription_file.filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            prescription_file.save(filepath)
+            try:
+                stored = storage.store_upload(prescription_file, app.config['UPLOAD_FOLDER'])
+            except storage.UnsupportedFileType:
+                flash('Please upload the prescription as a PDF, PNG or JPEG file.', 'error')
+                return render_template('order.html'), 400
+            filename = stored.path
+            original_name = prescription_file.filename
 
         # Get form data
         fullname = request.form.get('fullname')
@@ -102,13 +233,73 @@ def order():
         landmark = request.form.get('landmark')
 
         # Create order
-        db.create_medicine_order(user_id, fullname, phone, zipcode, town, landmark, filename)
+        order_id = db.create_medicine_order(user_id, fullname, phone, zipcode, town, landmark, filename, original_name)
+        jobs.enqueue('order_created', {'order_id': order_id, 'prescription_file': filename})
 
         flash('Order placed successfully!', 'success')
         return redirect(url_for('user_dashboard'))
 
     return render_template('order.html')
 
+# Prescription files are visible to the owning patient and to admins.
+# Doctors register themselves and orders have no doctor, so a doctor
+# session alone grants nothing.
+def check_prescription_access(filename):
+    if session.get('user_type') == 'admin':
+        return None
+    if 'user_id' not in session:
+        flash('Please login to access this page.', 'error')
+        return redirect(url_for('login'))
+    if not db.user_owns_prescription(session['user_id'], filename):
+        abort(404)
+    return None
+
+# Download an uploaded prescription
+@app.route('/prescriptions/<path:filename>')
+def download_prescription(filename):
+    denied = check_prescription_access(filename)
+    if denied:
+        return denied
+
+    sha256 = storage.content_hash(filename)
+    # Only PDFs and raster images open in the browser, with a fixed type;
+    # anything else (HTML, SVG, ...) could run script in the viewer's session
+    mimetype = storage.PRESCRIPTION_TYPES.get(os.path.splitext(filename)[1].lower())
+    response = send_from_directory(
+        app.config['UPLOAD_FOLDER'], filename,
+        mimetype=mimetype or 'application/octet-stream',
+        as_attachment=mimetype is None,
+        conditional=True,
+        etag=sha256 if sha256 else True,
+        max_age=app.config['PRESCRIPTION_MAX_AGE'] if sha256 else None,
+    )
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    # Prescriptions are personal data: browsers may cache, shared proxies may not
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if sha256:
+        response.cache_control.immutable = True
+    return response
+
+# First-page thumbnail of a prescription PDF
+@app.route('/prescription-thumbnails/<path:filename>')
+def prescription_thumbnail(filename):
+    denied = check_prescription_access(filename)
+    if denied:
+        return denied
+
+    document = db.get_prescription_document(filename)
+    if document is None or not document['thumbnail']:
+        abort(404)
+    response = send_from_directory(
+        app.config['UPLOAD_FOLDER'], document['thumbnail'],
+        mimetype='image/png', conditional=True, max_age=app.config['PRESCRIPTION_MAX_AGE'],
+    )
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
 # About page
 @app.route('/about')
 def about():
@@ -122,7 +313,8 @@ def contact():
         email = request.form.get('email')
         message = request.form.get('message')
 
-        db.create_contact_message(name, email, message)
+        message_id = db.create_contact_message(name, email, message)
+        jobs.enqueue('contact_message_created', {'message_id': message_id})
 
         flash('Thank you for contacting us! We will get back to you soon.', 'success')
         return redirect(url_for('contact'))
@@ -136,10 +328,14 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
 
-        # Check against database users
-        user = db.get_user_by_username(username)
+        # Check against database users (password hashing runs on the auth pool)
+        try:
+            user = auth.authenticate_patient(username, password)
+        except auth.VerificationBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('login.html'), 503
 
-        if user and user['password'] == password:
+        if user:
             session['logged_in'] = True
             session['user_id'] = user['id']
             session['username'] = user['username']
@@ -151,7 +347,7 @@ def login():
             session['username'] = username
             session['user_type'] = 'admin'
             flash(f'Welcome back, {username}!', 'success')
-            return redirect(url_for('home'))
+            return redirect(url_for('admin_dashboard'))
         else:
             flash('Invalid credentials! Please try again.', 'error')
             return render_template('login.html')
@@ -177,7 +373,12 @@ def register():
             return render_template('register.html')
 
         # Create new user with all fields
-        user_id = db.create_user(username, password, email, phone, full_name, age, gender)
+        try:
+            password_hash = auth.hash_password(password)
+        except auth.VerificationBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('register.html'), 503
+        user_id = db.create_user(username, password_hash, email, phone, full_name, age, gender)
 
         if user_id:
             flash('Registration successful! Please login with your credentials.', 'success')
@@ -216,8 +417,13 @@ def doctor_register():
             return render_template('doctor_register.html')
 
         # Create new doctor
+        try:
+            password_hash = auth.hash_password(password)
+        except auth.VerificationBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('doctor_register.html'), 503
         doctor_id = db.create_doctor(
-            username, password, full_name, specialization,
+            username, password_hash, full_name, specialization,
             email, phone, experience_years, qualification, consultation_fee
         )
 
@@ -237,9 +443,13 @@ def doctor_login():
         password = request.form.get('password')
 
         # Check against database doctors
-        doctor = db.get_doctor_by_username(username)
+        try:
+            doctor = auth.authenticate_doctor(username, password)
+        except auth.VerificationBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('doctor_login.html'), 503
 
-        if doctor and doctor['password'] == password:
+        if doctor:
             session['logged_in'] = True
             session['doctor_id'] = doctor['id']
             session['username'] = doctor['username']
@@ -258,16 +468,27 @@ def doctor_login():
 @doctor_login_required
 def doctor_dashboard():
     doctor_id = session.get('doctor_id')
+    page_size = db.clamp_page_size(request.args.get('per_page'))
 
-    # Get doctor's consultations
-    consultations = db.get_doctor_consultations(doctor_id)
-
-    # Get doctor's appointments
-    appointments = db.get_doctor_appointments(doctor_id)
+    # Load one page of consultations and appointments in a single read
+    dashboard = db.get_doctor_dashboard(doctor_id, page_size, {
+        'consultations': request.args.get('consultations'),
+        'appointments': request.args.get('appointments'),
+    })
+    consultations = dashboard['consultations']
+    appointments = dashboard['appointments']
 
     return render_template('doctor_dashboard.html',
-                         consultations=consultations,
-                         appointments=appointments,
+                         queue=[dict(row) for row in dashboard['queue'].rows],
+                         next_queue=dashboard['queue'].next_cursor,
+                         seq=dashboard['seq'],
+                         priorities=db.PRIORITIES,
+                         consultations=consultations.rows,
+                         appointments=appointments.rows,
+                         next_consultations=consultations.next_cursor,
+                         next_appointments=appointments.next_cursor,
+                         counts=dashboard['counts'],
+                         active_tab=request.args.get('tab', 'queue'),
                          doctor_name=session.get('doctor_name'))
 
 # Update consultation (for doctors)
@@ -277,35 +498,135 @@ def update_consultation(consultation_id):
     status = request.form.get('status')
     prescription = request.form.get('prescription')
     notes = request.form.get('notes')
+    priority = request.form.get('priority', type=int)
+    if priority not in db.PRIORITIES:
+        priority = None
+
+    db.update_consultation(consultation_id, status, prescription, notes, priority)
 
-    db.update_consultation(consultation_id, status, prescription, notes)
+    # The dashboard script posts with fetch and picks the change up by polling
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(updated=consultation_id)
 
     flash('Consultation updated successfully!', 'success')
     return redirect(url_for('doctor_dashboard'))
 
+# Doctor work queue API: pending consultations, most urgent then oldest first
+@app.route('/api/doctor/queue')
+@doctor_login_required
+def doctor_queue():
+    page, seq = db.get_doctor_queue(
+        session.get('doctor_id'),
+        db.clamp_page_size(request.args.get('per_page')),
+        request.args.get('cursor'),
+    )
+    return jsonify(consultations=[dict(row) for row in page.rows], next_cursor=page.next_cursor, seq=seq)
+
+# Consultations changed since the seq a doctor's page last saw
+@app.route('/api/doctor/changes')
+@doctor_login_required
+def doctor_changes():
+    doctor_id = session.get('doctor_id')
+    since = request.args.get('since', 0, type=int)
+    changes = db.get_consultation_changes(doctor_id, since, db.MAX_PAGE_SIZE)
+    return jsonify(
+        changes=[dict(row) for row in changes],
+        seq=changes[-1]['seq'] if changes else since,
+        more=len(changes) == db.MAX_PAGE_SIZE,
+        counts=db.get_doctor_counts(doctor_id) if changes else None,
+    )
+
+# Admin analytics dashboard (reads only the rollup and stats tables)
+@app.route('/admin-dashboard')
+@admin_login_required
+def admin_dashboard():
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), 366)
+    except ValueError:
+        days = 30
+    today = datetime.date.today()
+    since = (today - datetime.timedelta(days=days - 1)).isoformat()
+    until = today.isoformat()
+    # Appointments are booked ahead, so their window extends as far forward
+    upcoming = (today + datetime.timedelta(days=days)).isoformat()
+
+    return render_template('admin_dashboard.html',
+                         days=days,
+                         since=since,
+                         until=until,
+                         upcoming=upcoming,
+                         counts=db.get_table_counts(),
+                         last_refresh=analytics.get_last_refresh(),
+                         doctor_totals=analytics.get_doctor_totals(since, until),
+                         consultations_per_doctor=analytics.get_consultations_per_doctor(since, until),
+                         appointments_by_specialization=analytics.get_appointments_by_specialization(since, upcoming),
+                         orders_by_area=analytics.get_orders_by_area(since, until),
+                         pending_ages=analytics.get_pending_ages(),
+                         age_labels=[label for _, label in analytics.AGE_BUCKETS])
+
+# Fold new rows into the analytics rollups now instead of waiting for the refresher
+@app.route('/admin-dashboard/refresh', methods=['POST'])
+@admin_login_required
+def refresh_analytics():
+    folded = analytics.refresh()
+    flash(f'Analytics refreshed ({sum(folded.values())} new records).', 'success')
+    return redirect(url_for('admin_dashboard'))
+
+# Order triage for pharmacy staff: prescriptions with thumbnails and page counts
+@app.route('/admin-orders')
+@admin_login_required
+def admin_orders():
+    status = request.args.get('status', 'pending')
+    if status not in db.ORDER_STATUSES:
+        status = 'pending'
+    orders = db.get_order_queue(status, db.clamp_page_size(request.args.get('per_page')),
+                                request.args.get('cursor'))
+    return render_template('admin_orders.html',
+                         orders=orders.rows,
+                         next_cursor=orders.next_cursor,
+                         status=status,
+                         statuses=db.ORDER_STATUSES,
+                         counts=db.get_table_counts())
+
+# Move an order to another status from the triage list
+@app.route('/admin-orders/<int:order_id>', methods=['POST'])
+@admin_login_required
+def update_order(order_id):
+    status = request.form.get('status')
+    if status not in db.ORDER_STATUSES:
+        flash('Unknown order status.', 'error')
+    elif db.update_order_status(order_id, status):
+        flash(f'Order #{order_id} marked {status}.', 'success')
+    else:
+        flash(f'Order #{order_id} not found.', 'error')
+    return redirect(url_for('admin_orders', status=request.form.get('from', 'pending')))
+
 # User Dashboard
 @app.route('/user-dashboard')
 @login_required
 def user_dashboard():
     user_id = session.get('user_id')
-
-    # Get all doctors
-    doctors = db.get_all_doctors()
-
-    # Get user's consultations
-    consultations = db.get_user_consultations(user_id)
-
-    # Get user's appointments
-    appointments = db.get_user_appointments(user_id)
-
-    # Get user's orders
-    orders = db.get_user_orders(user_id)
+    page_size = db.clamp_page_size(request.args.get('per_page'))
+
+    # Load doctors and one page of each history list in a single read
+    dashboard = db.get_user_dashboard(user_id, page_size, {
+        'consultations': request.args.get('consultations'),
+        'appointments': request.args.get('appointments'),
+        'orders': request.args.get('orders'),
+    })
+    consultations = dashboard['consultations']
+    appointments = dashboard['appointments']
+    orders = dashboard['orders']
 
     return render_template('user_dashboard.html',
-                         doctors=doctors,
-                         consultations=consultations,
-                         appointments=appointments,
-                         orders=orders,
+                         doctors=dashboard['doctors'],
+                         consultations=consultations.rows,
+                         appointments=appointments.rows,
+                         orders=orders.rows,
+                         next_consultations=consultations.next_cursor,
+                         next_appointments=appointments.next_cursor,
+                         next_orders=orders.next_cursor,
+                         active_tab=request.args.get('tab', 'doctors'),
                          username=session.get('username'))
 
 # Book Appointment
@@ -313,19 +634,48 @@ def user_dashboard():
 @login_required
 def book_appointment(doctor_id):
     doctor = db.get_doctor_by_id(doctor_id)
+    # Checked before any slot is read or generated: slot generation writes
+    if doctor is None or not doctor['available']:
+        abort(404)
+    status = 200
 
     if request.method == 'POST':
         user_id = session.get('user_id')
-        appointment_date = request.form.get('appointment_date')
-        appointment_time = request.form.get('appointment_time')
+        # A slot from the list, or a date and time from older clients
+        slot = request.form.get('slot') or '{} {}'.format(
+            request.form.get('appointment_date', ''), request.form.get('appointment_time', ''))
         reason = request.form.get('reason')
 
-        appointment_id = db.create_appointment(user_id, doctor_id, appointment_date, appointment_time, reason)
-
-        flash('Appointment booked successfully!', 'success')
-        return redirect(url_for('user_dashboard'))
+        try:
+            appointment_date, appointment_time = slot.split()
+            appointment_id = slots.reserve(user_id, doctor_id, appointment_date, appointment_time, reason)
+        except ValueError:
+            flash('Please choose one of the available slots.', 'error')
+            status = 400
+        except slots.SlotUnavailable as e:
+            flash(f'{e} Please choose another slot.', 'error')
+            status = 409
+        else:
+            flash('Appointment booked successfully!', 'success')
+            return redirect(url_for('user_dashboard'))
 
-    return render_template('book_appointment.html', doctor=doctor)
+    # Free slots from the chosen day (or from now), read from the slot index
+    today = datetime.date.today()
+    after = None
+    slots_from = request.args.get('from')
+    try:
+        if slots_from and datetime.date.fromisoformat(slots_from) > today:
+            after = datetime.datetime.fromisoformat(slots_from)
+    except ValueError:
+        slots_from = None
+    free_slots = slots.next_free_slots(doctor_id, slots.DEFAULT_FREE_SLOTS, after)
+
+    return render_template('book_appointment.html', doctor=doctor,
+                           free_slots=free_slots,
+                           slots_from=slots_from,
+                           slot_days=slots.SLOT_DAYS,
+                           today=today.isoformat(),
+                           last_day=(today + datetime.timedelta(days=slots.SLOT_DAYS)).isoformat()), status
 
 # Request Prescription
 @app.route('/request-prescription/<int:doctor_id>', methods=['GET', 'POST'])
@@ -346,6 +696,7 @@ def request_prescription(doctor_id):
         consultation_id = db.create_consultation(
             user_id, doctor_id, fullname, age, gender, city, 'Prescription', problem
         )
+        jobs.enqueue('consultation_created', {'consultation_id': consultation_id})
 
         flash('Prescription request submitted successfully!', 'success')
         return redirect(url_for('user_dashboard'))
@@ -359,5 +710,26 @@ def logout():
     flash('You have been logged out successfully.', 'success')
     return redirect(url_for('home'))
 
+# Background job handlers (run on job worker threads, outside any request)
+@jobs.handler('consultation_created')
+def consultation_created(payload):
+    app.logger.info('Consultation %s submitted', payload['consultation_id'])
+
+@jobs.handler('order_created')
+def order_created(payload):
+    app.logger.info('Medicine order %s placed', payload['order_id'])
+    if payload.get('prescription_file'):
+        prescriptions.process_prescription(payload['prescription_file'], app.config['UPLOAD_FOLDER'])
+
+@jobs.handler('contact_message_created')
+def contact_message_created(payload):
+    app.logger.info('Contact message %s received', payload['message_id'])
+
+# Start the job workers and the analytics refresher once every job handler
+# above is registered, or due jobs would fail with no handler
+if multiprocessing.parent_process() is None:
+    jobs.start()
+    analytics.start()
+
 if __name__ == '__main__':
     app.run(debug=True)
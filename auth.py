@@ -0,0 +1,151 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+
+# Key derivation for new passwords: 'scrypt' or 'pbkdf2_sha256'
+PASSWORD_HASH = os.environ.get('HEALTHCONNECT_PASSWORD_HASH', 'scrypt')
+
+# scrypt cost (CPU/memory = 128 * N * r bytes) and PBKDF2 iterations.
+# Stored hashes keep their own parameters; changing these rehashes
+# passwords on the next successful login.
+SCRYPT_N = int(os.environ.get('HEALTHCONNECT_SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.environ.get('HEALTHCONNECT_SCRYPT_R', 8))
+SCRYPT_P = int(os.environ.get('HEALTHCONNECT_SCRYPT_P', 1))
+PBKDF2_ITERATIONS = int(os.environ.get('HEALTHCONNECT_PBKDF2_ITERATIONS', 600000))
+
+# Threads that run key derivation (it releases the GIL, so one per core),
+# and how many more requests may wait for one before logins are refused
+WORKERS = int(os.environ.get('HEALTHCONNECT_AUTH_WORKERS', os.cpu_count() or 1))
+MAX_WAITING = int(os.environ.get('HEALTHCONNECT_AUTH_QUEUE', 32))
+WAIT_TIMEOUT = 10.0  # seconds a request waits for a free slot
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+class VerificationBusy(Exception):
+    """Raised when too many password checks are already waiting"""
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(WORKERS + MAX_WAITING)
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def _derive(algorithm, password, salt, params):
+    secret = password.encode('utf-8')
+    if algorithm == 'scrypt':
+        n, r, p = params
+        return hashlib.scrypt(secret, salt=salt, n=n, r=r, p=p, maxmem=256 * r * (n + p) + 1024 * 1024,
+                              dklen=KEY_BYTES)
+    if algorithm == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', secret, salt, params[0], dklen=KEY_BYTES)
+    raise ValueError(f"Unknown password hash: {algorithm}")
+
+def _current_params(algorithm):
+    if algorithm == 'scrypt':
+        return (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return (PBKDF2_ITERATIONS,)
+
+def _parse(stored):
+    """Split a stored hash into (algorithm, params, salt, key), or None for plaintext"""
+    parts = (stored or '').split('$')
+    if len(parts) < 4 or parts[0] not in ('scrypt', 'pbkdf2_sha256'):
+        return None
+    try:
+        params = tuple(int(value) for value in parts[1:-2])
+        return parts[0], params, _unb64(parts[-2]), _unb64(parts[-1])
+    except ValueError:
+        return None
+
+def make_hash(password, algorithm=None):
+    """Hash a password with a fresh salt (runs on the calling thread)"""
+    algorithm = algorithm or PASSWORD_HASH
+    params = _current_params(algorithm)
+    salt = os.urandom(SALT_BYTES)
+    key = _derive(algorithm, password, salt, params)
+    return '$'.join([algorithm, *map(str, params), _b64(salt), _b64(key)])
+
+def check_hash(stored, password):
+    """Compare a password with a stored hash or legacy plaintext value"""
+    parsed = _parse(stored)
+    if parsed is None:
+        return stored is not None and hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+    algorithm, params, salt, key = parsed
+    return hmac.compare_digest(_derive(algorithm, password, salt, params), key)
+
+def needs_rehash(stored):
+    """True for plaintext rows and hashes made with other settings"""
+    parsed = _parse(stored)
+    return parsed is None or parsed[0] != PASSWORD_HASH or parsed[1] != _current_params(PASSWORD_HASH)
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='auth')
+        return _executor
+
+def _run(f, *args):
+    """Run f on the bounded key-derivation pool and wait for the result"""
+    if not _slots.acquire(timeout=WAIT_TIMEOUT):
+        raise VerificationBusy('Too many password checks in progress')
+    try:
+        return _get_executor().submit(f, *args).result()
+    finally:
+        _slots.release()
+
+def hash_password(password):
+    """Hash a password on the key-derivation pool"""
+    return _run(make_hash, password)
+
+def verify_password(stored, password):
+    """Check a password on the key-derivation pool"""
+    return _run(check_hash, stored, password)
+
+# Checked when the username does not exist, so unknown and known
+# usernames take the same time to reject
+_dummy_hash = None
+
+def _verify_login(credentials, password):
+    global _dummy_hash
+    if credentials is None:
+        if _dummy_hash is None:
+            _dummy_hash = make_hash('not a password')
+        check_hash(_dummy_hash, password)
+        return False
+    return check_hash(credentials['password'], password)
+
+def authenticate_patient(username, password):
+    """Return the patient's (id, username) row if the password matches, else None"""
+    credentials = db.get_user_credentials(username)
+    if not password or not _run(_verify_login, credentials, password):
+        return None
+    if needs_rehash(credentials['password']):
+        db.set_user_password(credentials['id'], hash_password(password))
+    return credentials
+
+def authenticate_doctor(username, password):
+    """Return the doctor's (id, username, full_name) row if the password matches, else None"""
+    credentials = db.get_doctor_credentials(username)
+    if not password or not _run(_verify_login, credentials, password):
+        return None
+    if needs_rehash(credentials['password']):
+        db.set_doctor_password(credentials['id'], hash_password(password))
+    return credentials
+
+def shutdown():
+    """Stop the key-derivation threads"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
@@ -0,0 +1,361 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import add_sample_data
+import analytics
+import auth
+import database as db
+import jobs
+import slots
+
+# Default dataset and run sizes; small enough for a quick local run
+PATIENTS = 2000
+DOCTORS = 50
+ITERATIONS = 200
+WARMUP = 20
+
+# A p95 this much slower than the baseline counts as a regression
+THRESHOLD = 0.20
+
+# Accounts the login and route benchmarks sign in with. Stored passwords
+# are hashes, so the benchmark seeds its own known credentials.
+BENCH_PATIENT = 'bench_patient'
+BENCH_DOCTOR = 'bench_doctor'
+BENCH_PASSWORD = 'bench-password'
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(p / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def measure(f, iterations, warmup):
+    """Time f(i) for each iteration; returns latency statistics in milliseconds"""
+    for i in range(warmup):
+        f(i)
+    timings = []
+    start = time.perf_counter()
+    for i in range(warmup, warmup + iterations):
+        t = time.perf_counter()
+        f(i)
+        timings.append((time.perf_counter() - t) * 1000)
+    elapsed = time.perf_counter() - start
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'mean_ms': sum(timings) / len(timings),
+        'min_ms': timings[0],
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+        'max_ms': timings[-1],
+        'ops_per_sec': iterations / elapsed if elapsed else None,
+    }
+
+def _sample_ids(table, count, seed):
+    conn = db.get_db_connection()
+    ids = [row['id'] for row in conn.execute(f'SELECT id FROM {table} ORDER BY id')]
+    conn.close()
+    rng = random.Random(seed)
+    return [rng.choice(ids) for _ in range(count)] if ids else []
+
+def seed_accounts():
+    """Create (or reset) the bench patient and doctor; returns their (user_id, doctor_id).
+
+    The doctor gets a page of consultations from the patient, so the
+    dashboards and the work queue have rows to render.
+    """
+    password = auth.make_hash(BENCH_PASSWORD)
+    user_id = db.create_user(BENCH_PATIENT, password, full_name='Bench Patient', age=30, gender='Male')
+    if user_id is None:
+        user_id = db.get_user_credentials(BENCH_PATIENT)['id']
+        db.set_user_password(user_id, password)
+    doctor_id = db.create_doctor(BENCH_DOCTOR, password, 'Dr. Bench', 'General Physician')
+    if doctor_id is None:
+        doctor_id = db.get_doctor_credentials(BENCH_DOCTOR)['id']
+        db.set_doctor_password(doctor_id, password)
+    for _ in range(db.DEFAULT_PAGE_SIZE):
+        db.create_consultation(user_id, doctor_id, 'Bench Patient', 30, 'Male', 'Mumbai', 'Prescription', 'Benchmark')
+    return user_id, doctor_id
+
+def database_cases(seed):
+    """Benchmarks for the helpers in database.py, keyed by name"""
+    users = _sample_ids('users', 1000, seed)
+    doctors = _sample_ids('doctors', 1000, seed + 1)
+    consultations = _sample_ids('consultations', 1000, seed + 2)
+    conn = db.get_db_connection()
+    usernames = {user_id: conn.execute('SELECT username FROM users WHERE id = ?', (user_id,)).fetchone()[0]
+                 for user_id in set(users)}
+    conn.close()
+    names = [db.get_doctor_by_id(doctor_id)['full_name'] for doctor_id in doctors[:50]]
+
+    def user(i):
+        return users[i % len(users)]
+
+    def doctor(i):
+        return doctors[i % len(doctors)]
+
+    def reserve(i):
+        free = slots.next_free_slots(doctor(i), 1)
+        if free:
+            try:
+                slots.reserve(user(i), doctor(i), *free[0], 'Benchmark')
+            except slots.SlotUnavailable:
+                pass
+
+    return {
+        'db.get_user_by_username': lambda i: db.get_user_by_username(usernames[user(i)]),
+        'db.get_all_doctors': lambda i: db.get_all_doctors(),
+        'db.get_doctor_by_id': lambda i: db.get_doctor_by_id(doctor(i)),
+        'db.find_doctor': lambda i: db.find_doctor(names[i % len(names)]),
+        'db.search_doctors': lambda i: db.search_doctors(text='dr', limit=db.DEFAULT_PAGE_SIZE),
+        'db.search_doctors_filtered': lambda i: db.search_doctors(
+            specialization='Cardiologist', min_fee=500, limit=db.DEFAULT_PAGE_SIZE),
+        'db.get_user_consultations': lambda i: db.get_user_consultations(user(i), db.DEFAULT_PAGE_SIZE),
+        'db.get_user_appointments': lambda i: db.get_user_appointments(user(i), db.DEFAULT_PAGE_SIZE),
+        'db.get_user_orders': lambda i: db.get_user_orders(user(i), db.DEFAULT_PAGE_SIZE),
+        'db.get_doctor_consultations': lambda i: db.get_doctor_consultations(doctor(i), db.DEFAULT_PAGE_SIZE),
+        'db.get_doctor_appointments': lambda i: db.get_doctor_appointments(doctor(i), db.DEFAULT_PAGE_SIZE),
+        'db.get_user_dashboard': lambda i: db.get_user_dashboard(user(i)),
+        'db.get_doctor_dashboard': lambda i: db.get_doctor_dashboard(doctor(i)),
+        'db.get_doctor_queue': lambda i: db.get_doctor_queue(doctor(i)),
+        'db.get_consultation_changes': lambda i: db.get_consultation_changes(doctor(i), 0, db.DEFAULT_PAGE_SIZE),
+        'db.create_user': lambda i: db.create_user(
+            f'bench_{seed}_{i}_{time.time_ns()}', 'secret', full_name='Bench User'),
+        'db.create_consultation': lambda i: db.create_consultation(
+            user(i), doctor(i), 'Bench User', 30, 'Male', 'Mumbai', 'Prescription', 'Benchmark'),
+        'db.update_consultation': lambda i: db.update_consultation(
+            consultations[i % len(consultations)], 'in-progress', None, 'Benchmark'),
+        'db.create_appointment': lambda i: db.create_appointment(
+            user(i), doctor(i), '2030-01-01', '10:00', 'Benchmark'),
+        'slots.next_free_slots': lambda i: slots.next_free_slots(doctor(i)),
+        'slots.reserve': reserve,
+        'db.create_medicine_order': lambda i: db.create_medicine_order(
+            user(i), 'Bench User', '+91 90000 00000', '400001', 'Mumbai', 'Benchmark', None),
+        'db.create_contact_message': lambda i: db.create_contact_message('Bench', 'bench@example.com', 'Hi'),
+    }
+
+def auth_cases():
+    """Benchmarks for password hashing and the patient login check"""
+    hashes = {algorithm: auth.make_hash(BENCH_PASSWORD, algorithm) for algorithm in ('scrypt', 'pbkdf2_sha256')}
+
+    def login(i):
+        if auth.authenticate_patient(BENCH_PATIENT, BENCH_PASSWORD) is None:
+            raise RuntimeError(f"{BENCH_PATIENT} could not log in")
+
+    return {
+        'auth.check_hash_scrypt': lambda i: auth.check_hash(hashes['scrypt'], BENCH_PASSWORD),
+        'auth.check_hash_pbkdf2_sha256': lambda i: auth.check_hash(hashes['pbkdf2_sha256'], BENCH_PASSWORD),
+        'auth.authenticate_patient': login,
+    }
+
+def parallel_logins(iterations, threads=None):
+    """Logins per second with one thread per core all calling authenticate_patient"""
+    threads = threads or os.cpu_count() or 1
+    per_thread = max(1, iterations // threads)
+
+    def run():
+        for _ in range(per_thread):
+            auth.authenticate_patient(BENCH_PATIENT, BENCH_PASSWORD)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    logins = per_thread * threads
+    return {'threads': threads, 'logins': logins, 'logins_per_sec': logins / elapsed,
+            'logins_per_sec_per_core': logins / elapsed / (os.cpu_count() or 1)}
+
+def route_cases(app, doctor_id):
+    """Benchmarks for the routes in app.py through the Flask test client"""
+    conn = db.get_db_connection()
+    consultation = conn.execute('SELECT MAX(id) FROM consultations WHERE doctor_id = ?', (doctor_id,)).fetchone()[0]
+    conn.close()
+    patient = {'username': BENCH_PATIENT, 'password': BENCH_PASSWORD}
+    physician = {'username': BENCH_DOCTOR, 'password': BENCH_PASSWORD}
+
+    def check(response, *statuses):
+        if response.status_code not in statuses:
+            raise RuntimeError(f"{response.request.path} returned {response.status_code}")
+        return response
+
+    anonymous = app.test_client()
+    client = app.test_client()
+    check(client.post('/login', data=patient), 302)
+    doctor_client = app.test_client()
+    check(doctor_client.post('/doctor-login', data=physician), 302)
+    admin_client = app.test_client()
+    check(admin_client.post('/login', data={'username': 'admin', 'password': '1234'}), 302)
+
+    def book(i):
+        # 409 when the patient already has an appointment at the doctor's next free time
+        free = slots.next_free_slots(doctor_id, 1)
+        return check(client.post(f'/book-appointment/{doctor_id}', data={
+            'slot': ' '.join(free[0]) if free else '', 'reason': 'Benchmark'}), 302, 400, 409)
+
+    return {
+        'GET /': lambda i: check(anonymous.get('/'), 200),
+        'GET /about': lambda i: check(anonymous.get('/about'), 200),
+        'GET /contact': lambda i: check(anonymous.get('/contact'), 200),
+        'POST /login': lambda i: check(anonymous.post('/login', data=patient), 302),
+        'POST /doctor-login': lambda i: check(anonymous.post('/doctor-login', data=physician), 302),
+        'GET /api/doctors/search': lambda i: check(anonymous.get('/api/doctors/search?q=dr'), 200),
+        'GET /doctor': lambda i: check(client.get('/doctor'), 200),
+        'GET /user-dashboard': lambda i: check(client.get('/user-dashboard'), 200),
+        'GET /book-appointment': lambda i: check(client.get(f'/book-appointment/{doctor_id}'), 200),
+        'GET /doctor-dashboard': lambda i: check(doctor_client.get('/doctor-dashboard'), 200),
+        'GET /api/doctor/queue': lambda i: check(doctor_client.get('/api/doctor/queue'), 200),
+        'GET /api/doctor/changes': lambda i: check(doctor_client.get(f'/api/doctor/changes?since={2 ** 62}'), 200),
+        'GET /admin-dashboard': lambda i: check(admin_client.get('/admin-dashboard?days=90'), 200),
+        'POST /doctor': lambda i: check(client.post('/doctor', data={
+            'fullname': 'Bench User', 'age': '30', 'gender': 'Male', 'city': 'Mumbai',
+            'doctor': str(doctor_id), 'service': 'Prescription', 'problem': 'Benchmark'}), 302),
+        'POST /book-appointment': book,
+        'POST /order': lambda i: check(client.post('/order', data={
+            'fullname': 'Bench User', 'phone': '+91 90000 00000', 'zipcode': '400001', 'town': 'Mumbai',
+            'landmark': 'Benchmark', 'prescription': (io.BytesIO(b'%PDF-1.4 benchmark prescription'), 'rx.pdf'),
+        }, content_type='multipart/form-data'), 302),
+        'POST /contact': lambda i: check(anonymous.post('/contact', data={
+            'name': 'Bench', 'email': 'bench@example.com', 'message': 'Hi'}), 302),
+        'POST /update-consultation': lambda i: check(doctor_client.post(
+            f'/update-consultation/{consultation}',
+            data={'status': 'in-progress', 'prescription': '', 'notes': 'Benchmark'}), 302),
+    }
+
+def copy_database(source, target):
+    """Copy a database file with its WAL and shared-memory files, if any"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(source + suffix):
+            shutil.copyfile(source + suffix, target + suffix)
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(baseline, current, threshold=THRESHOLD):
+    """Print p95 changes against a baseline run; returns the regressed names"""
+    regressions = []
+    print(f"\n{'benchmark':<32} {'base p95':>10} {'p95':>10} {'change':>8}")
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if not base or not base['p95_ms']:
+            print(f"{name:<32} {'-':>10} {result['p95_ms']:>10.3f} {'new':>8}")
+            continue
+        change = result['p95_ms'] / base['p95_ms'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<32} {base['p95_ms']:>10.3f} {result['p95_ms']:>10.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark HealthConnect database helpers and routes')
+    parser.add_argument('--database', help='benchmark an existing database file (default: generate one)')
+    parser.add_argument('--patients', type=int, default=PATIENTS, help='patients in the generated dataset')
+    parser.add_argument('--doctors', type=int, default=DOCTORS, help='doctors in the generated dataset')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for data and inputs')
+    parser.add_argument('--iterations', '-n', type=int, default=ITERATIONS, help='timed calls per benchmark')
+    parser.add_argument('--warmup', type=int, default=WARMUP, help='untimed calls per benchmark')
+    parser.add_argument('--filter', '-k', help='only run benchmarks whose name contains this text')
+    parser.add_argument('--output', '-o', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='p95 slowdown that fails the comparison (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    # Run in a scratch directory so uploads, the write benchmarks and a
+    # generated database never touch the working copy or --database
+    workdir = tempfile.mkdtemp(prefix='healthconnect-bench-')
+    database = os.path.join(workdir, 'bench.db')
+    if args.database:
+        copy_database(args.database, database)
+    os.chdir(workdir)
+    db.DATABASE = database
+    db.init_db()
+    if not args.database:
+        # Anchored on today so the date-windowed pages (admin analytics,
+        # upcoming appointments) have data to show
+        add_sample_data.generate_dataset(args.patients, args.doctors, args.seed, anchor=datetime.datetime.now())
+
+    _, doctor_id = seed_accounts()
+
+    from app import app
+    cases = database_cases(args.seed)
+    cases.update(auth_cases())
+    cases.update(route_cases(app, doctor_id))
+
+    results = {}
+    print(f"\n{'benchmark':<32} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>9}")
+    for name, f in cases.items():
+        if args.filter and args.filter not in name:
+            continue
+        result = measure(f, args.iterations, args.warmup)
+        results[name] = result
+        print(f"{name:<32} {result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f} "
+              f"{result['p99_ms']:>9.3f} {result['ops_per_sec']:>9.0f}")
+
+    logins = None
+    name = 'auth.parallel_logins'
+    if not args.filter or args.filter in name:
+        logins = parallel_logins(args.iterations)
+        print(f"\nParallel logins: {logins['logins_per_sec']:.1f}/s with {logins['threads']} threads "
+              f"({logins['logins_per_sec_per_core']:.1f}/s per core)")
+
+    conn = db.get_db_connection()
+    rows = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            for table in ('users', 'doctors', 'consultations', 'appointments', 'medicine_orders')}
+    conn.close()
+    report = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'storage_profile': db.STORAGE_PROFILE,
+        'dataset': {'database': args.database, 'seed': args.seed, 'rows': rows},
+        'iterations': args.iterations,
+        'warmup': args.warmup,
+        'results': results,
+        'parallel_logins': logins,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {output}")
+
+    jobs.stop()
+    analytics.stop()
+    db.close_pool()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if baseline and compare(baseline, report, args.threshold):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
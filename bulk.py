@@ -0,0 +1,190 @@
+import argparse
+import csv
+import json
+import os
+import sys
+
+import database as db
+
+# Tables handled by "all", in an order that keeps foreign keys valid on import
+TABLES = ['users', 'doctors', 'consultations', 'appointments', 'medicine_orders', 'contact_messages']
+
+BATCH_SIZE = 5000          # rows per fetchmany()/executemany() call
+COMMIT_EVERY = 100000      # rows per import transaction
+
+# How CSV files spell NULL, so empty strings survive an export and import
+NULL_MARKER = r'\N'
+
+def table_columns(conn, table):
+    """Return the column names of a table, or raise ValueError if it does not exist"""
+    columns = [row['name'] for row in conn.execute('SELECT name FROM pragma_table_info(?)', (table,))]
+    if not columns:
+        raise ValueError(f"Unknown table: {table}")
+    return columns
+
+def _order_columns(conn, table):
+    """Primary key columns in key order, or rowid for tables without one.
+
+    WITHOUT ROWID tables (sessions, stats, rollups, ...) have no rowid.
+    """
+    rows = conn.execute('SELECT name, pk FROM pragma_table_info(?) WHERE pk > 0 ORDER BY pk', (table,)).fetchall()
+    return [row['name'] for row in rows] or ['rowid']
+
+def _text_columns(conn, table):
+    """Columns with TEXT affinity, where an empty CSV field is an empty string"""
+    return {row['name'] for row in conn.execute('SELECT name, type FROM pragma_table_info(?)', (table,))
+            if any(name in row['type'].upper() for name in ('CHAR', 'CLOB', 'TEXT'))}
+
+def _format_for(path, fmt):
+    if fmt:
+        return fmt
+    return 'ndjson' if path and path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+def export_table(table, out, fmt='csv', batch_size=BATCH_SIZE):
+    """Stream every row of table to the file object out; returns the row count"""
+    conn = db.get_db_connection()
+    columns = table_columns(conn, table)
+    cursor = conn.execute(f'SELECT {", ".join(columns)} FROM {table} ORDER BY {", ".join(_order_columns(conn, table))}')
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(columns)
+
+    count = 0
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        if writer:
+            writer.writerows(tuple(NULL_MARKER if value is None else value for value in row) for row in rows)
+        else:
+            for row in rows:
+                out.write(json.dumps(dict(zip(columns, row)), separators=(',', ':'), default=str))
+                out.write('\n')
+        count += len(rows)
+    conn.close()
+    return count
+
+def _read_rows(source, fmt, columns, text_columns=()):
+    """Yield (header, row) pairs with values in header order.
+
+    In CSV, NULL_MARKER is NULL. An empty field is an empty string in
+    text columns and NULL in the others (numbers, dates, booleans).
+    """
+    if fmt == 'csv':
+        reader = csv.reader(source)
+        header = next(reader, None) or []
+        keep_empty = [column in text_columns for column in header]
+        for values in reader:
+            yield header, [None if value == NULL_MARKER or (value == '' and not keep) else value
+                           for value, keep in zip(values, keep_empty, strict=True)]
+    else:
+        for line in source:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            header = [column for column in columns if column in record]
+            yield header, [record[column] for column in header]
+
+def import_table(table, source, fmt='csv', batch_size=BATCH_SIZE, commit_every=COMMIT_EVERY,
+                 on_conflict='abort'):
+    """Load rows from the file object source into table; returns the row count"""
+    verb = {'abort': 'INSERT', 'ignore': 'INSERT OR IGNORE', 'replace': 'INSERT OR REPLACE'}[on_conflict]
+    conn = db.get_db_connection()
+
+    query = None
+    current_header = None
+    batch = []
+    count = 0
+    since_commit = 0
+
+    def flush():
+        nonlocal since_commit
+        conn.executemany(query, batch)
+        since_commit += len(batch)
+        batch.clear()
+        if since_commit >= commit_every:
+            conn.commit()
+            since_commit = 0
+
+    try:
+        columns = table_columns(conn, table)
+        conn.execute('BEGIN IMMEDIATE')
+        for header, values in _read_rows(source, fmt, columns, _text_columns(conn, table)):
+            if header != current_header:
+                unknown = set(header) - set(columns)
+                if unknown:
+                    raise ValueError(f"Unknown columns for {table}: {', '.join(sorted(unknown))}")
+                if batch:
+                    flush()
+                current_header = header
+                query = f'{verb} INTO {table} ({", ".join(header)}) VALUES ({", ".join("?" * len(header))})'
+            batch.append(values)
+            count += 1
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return count
+
+def _export(args):
+    tables = TABLES if args.table == 'all' else [args.table]
+    for table in tables:
+        fmt = _format_for(args.output, args.format)
+        if args.table == 'all':
+            os.makedirs(args.output or '.', exist_ok=True)
+            path = os.path.join(args.output or '.', f'{table}.{fmt}')
+        else:
+            path = args.output
+        if path and path != '-':
+            with open(path, 'w', newline='', encoding='utf-8') as out:
+                count = export_table(table, out, fmt, args.batch_size)
+        else:
+            count = export_table(table, sys.stdout, fmt, args.batch_size)
+        print(f"Exported {count} rows from {table}", file=sys.stderr)
+
+def _import(args):
+    fmt = _format_for(args.input, args.format)
+    if args.input == '-':
+        count = import_table(args.table, sys.stdin, fmt, args.batch_size, args.commit_every, args.on_conflict)
+    else:
+        with open(args.input, newline='', encoding='utf-8') as source:
+            count = import_table(args.table, source, fmt, args.batch_size, args.commit_every, args.on_conflict)
+    print(f"Imported {count} rows into {args.table}", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk import/export HealthConnect tables')
+    parser.add_argument('--database', default=db.DATABASE, help='SQLite database file')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='rows per batch')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help='write a table as CSV or NDJSON')
+    export.add_argument('table', help="table name, or 'all' to export every table into a directory")
+    export.add_argument('--output', '-o', help="output file ('-' for stdout) or directory for 'all'")
+    export.add_argument('--format', choices=['csv', 'ndjson'], help='default: from file extension, else csv')
+    export.set_defaults(func=_export)
+
+    load = commands.add_parser('import', help='load CSV or NDJSON rows into a table')
+    load.add_argument('table', help='table name')
+    load.add_argument('input', help="input file ('-' for stdin)")
+    load.add_argument('--format', choices=['csv', 'ndjson'], help='default: from file extension, else csv')
+    load.add_argument('--commit-every', type=int, default=COMMIT_EVERY, help='rows per transaction')
+    load.add_argument('--on-conflict', choices=['abort', 'ignore', 'replace'], default='abort',
+                      help='what to do with rows that violate a unique constraint')
+    load.set_defaults(func=_import)
+
+    args = parser.parse_args(argv)
+    db.DATABASE = args.database
+    if args.command == 'import':
+        db.init_db()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
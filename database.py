@@ -1,20 +1,942 @@
 import sqlite3
 from datetime import datetime
 import os
+import base64
+import json
+import queue
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from functools import wraps
 
 DATABASE = 'healthconnect.db'
 
-def get_db_connection():
-    """Create and return a database connection"""
-    conn = sqlite3.connect(DATABASE)
+# Maximum number of idle connections kept open for reuse
+POOL_SIZE = int(os.environ.get('HEALTHCONNECT_DB_POOL_SIZE', 8))
+
+# Group commit: when enabled, single-row inserts from the form helpers are
+# queued to one writer thread that commits them together in one transaction
+GROUP_COMMIT = os.environ.get('HEALTHCONNECT_GROUP_COMMIT') == '1'
+GROUP_COMMIT_MAX_DELAY = float(os.environ.get('HEALTHCONNECT_GROUP_COMMIT_DELAY_MS', 5)) / 1000
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('HEALTHCONNECT_GROUP_COMMIT_BATCH', 256))
+GROUP_COMMIT_QUEUE_SIZE = int(os.environ.get('HEALTHCONNECT_GROUP_COMMIT_QUEUE', 2048))
+GROUP_COMMIT_SUBMIT_TIMEOUT = 1.0  # seconds a caller waits for queue space
+
+# Time every statement and count the rows it returns (see InstrumentedCursor)
+SQL_METRICS = os.environ.get('HEALTHCONNECT_SQL_METRICS', '1') == '1'
+
+# Seconds a cached doctor directory entry stays valid. Writes in this
+# process invalidate immediately; the TTL bounds staleness across processes.
+DOCTOR_CACHE_TTL = float(os.environ.get('HEALTHCONNECT_DOCTOR_CACHE_TTL', 60))
+
+# Storage profiles: journal mode is persistent and set in init_db(),
+# the remaining PRAGMAs are applied to every new connection
+STORAGE_PROFILES = {
+    'concurrent': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,       # KiB when negative (16MB)
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,       # ms
+    },
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -16000,
+        'mmap_size': 0,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 10000,
+    },
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,
+    },
+}
+
+STORAGE_PROFILE = os.environ.get('HEALTHCONNECT_DB_PROFILE', 'concurrent')
+
+# Retry policy for writes that still hit "database is locked"
+WRITE_RETRIES = int(os.environ.get('HEALTHCONNECT_DB_WRITE_RETRIES', 5))
+WRITE_BACKOFF = 0.05  # seconds, doubled on each attempt
+
+_statement_observers = []
+_query_tracking = threading.local()
+
+def add_statement_observer(f):
+    """Call f(sql, parameters, seconds, rows) after every instrumented statement"""
+    _statement_observers.append(f)
+    return f
+
+def start_query_tracking():
+    """Start totalling statements run by this thread (e.g. for one request)"""
+    _query_tracking.stats = {'queries': 0, 'seconds': 0.0, 'rows': 0}
+
+def stop_query_tracking():
+    """Stop totalling and return the totals, or None if tracking was off"""
+    stats = getattr(_query_tracking, 'stats', None)
+    _query_tracking.stats = None
+    return stats
+
+def _observe_statement(sql, parameters, seconds, rows):
+    stats = getattr(_query_tracking, 'stats', None)
+    if stats is not None:
+        stats['queries'] += 1
+        stats['seconds'] += seconds
+        stats['rows'] += rows
+    for f in _statement_observers:
+        f(sql, parameters, seconds, rows)
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each statement, including fetching its rows.
+
+    A statement is reported once it is finished: when its rows are
+    exhausted, or when the cursor is reused, closed or garbage collected.
+    """
+
+    _sql = None
+
+    def _finish(self, rows=0):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            _observe_statement(sql, self._parameters, self._seconds, self._rows + rows)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._seconds += time.perf_counter() - start
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._sql, self._parameters, self._seconds, self._rows = sql, parameters, 0.0, 0
+        self._timed(super().execute, sql, parameters)
+        if self.description is None:
+            self._finish(max(self.rowcount, 0))
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        self._sql, self._parameters, self._seconds, self._rows = sql, None, 0.0, 0
+        self._timed(super().executemany, sql, seq_of_parameters)
+        self._finish(max(self.rowcount, 0))
+        return self
+
+    def fetchone(self):
+        if self._sql is None:
+            return super().fetchone()
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        if self._sql is None:
+            return super().fetchmany(size or self.arraysize)
+        size = size or self.arraysize
+        rows = self._timed(super().fetchmany, size)
+        self._rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        if self._sql is None:
+            return super().fetchall()
+        rows = self._timed(super().fetchall)
+        self._finish(len(rows))
+        return rows
+
+    def __next__(self):
+        if self._sql is None:
+            return super().__next__()
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+class PooledConnection(sqlite3.Connection):
+    """SQLite connection whose close() hands it back to the pool"""
+
+    def cursor(self, factory=None):
+        """Open an instrumented cursor when SQL_METRICS is on"""
+        if factory is None:
+            factory = InstrumentedCursor if SQL_METRICS else sqlite3.Cursor
+        return super().cursor(factory)
+
+    # sqlite3 builds these shortcuts on its own cursor, bypassing cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        """Return the connection to the pool instead of closing it"""
+        _pool.release(self)
+
+    def really_close(self):
+        """Close the underlying SQLite handle"""
+        super().close()
+
+class ConnectionPool:
+    """Thread-safe pool of configured SQLite connections"""
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self.database = None
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'returned': 0, 'discarded': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def acquire(self):
+        """Get an idle connection or open a new one"""
+        if self.database != DATABASE:
+            self.clear()
+            self.database = DATABASE
+        try:
+            conn = self._idle.get_nowait()
+            conn.pooled = False
+            self._count('hits')
+            return conn
+        except queue.Empty:
+            self._count('misses')
+        conn = sqlite3.connect(DATABASE, factory=PooledConnection, check_same_thread=False)
+        _configure_connection(conn)
+        return conn
+
+    def release(self, conn):
+        """Roll back leftovers and keep the connection if there is room"""
+        if getattr(conn, 'pooled', False):
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.ProgrammingError:
+            return
+        if self.database == DATABASE and self._idle.qsize() < self.size:
+            conn.pooled = True
+            self._idle.put(conn)
+            self._count('returned')
+        else:
+            conn.really_close()
+            self._count('discarded')
+
+    def clear(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().really_close()
+            except queue.Empty:
+                break
+
+_pool = ConnectionPool()
+
+# Doctor lookup index over the cached directory
+DoctorIndex = namedtuple('DoctorIndex', ['by_id', 'by_name'])
+
+# Keyset pagination limits for dashboard lists
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# One page of rows plus the cursor for the next (older) page, or None
+Page = namedtuple('Page', ['rows', 'next_cursor'])
+
+# Tables with trigger-maintained row counts in the stats table, and the
+# columns they are also broken down by (one counter per value)
+STATS_TABLES = {
+    'users': [],
+    'doctors': [],
+    'consultations': ['status', 'doctor_id'],
+    'appointments': ['status', 'doctor_id'],
+    'medicine_orders': ['status'],
+    'contact_messages': ['status'],
+}
+
+# Consultation priorities, most urgent first; the work queue sorts by
+# the number so that keyset paging runs in one direction
+PRIORITIES = {0: 'urgent', 1: 'high', 2: 'normal', 3: 'low'}
+DEFAULT_PRIORITY = 2
+
+# Medicine order statuses an admin can set while triaging orders
+ORDER_STATUSES = ('pending', 'processing', 'completed', 'cancelled')
+
+# Working hours given to every doctor until they set their own:
+# (weekday with Monday = 0, start, end, minutes per appointment slot)
+DEFAULT_DOCTOR_HOURS = [
+    (weekday, start, end, 30)
+    for weekday in range(6)
+    for start, end in (('09:00', '13:00'), ('14:00', '17:00'))
+]
+
+# Schema migrations applied by init_db(), in order. PRAGMA user_version
+# records the last applied version so existing databases upgrade in place.
+# A step is either an SQL string or a callable taking the connection.
+MIGRATIONS = [
+    (1, 'Indexes for dashboard queries', [
+        'CREATE INDEX IF NOT EXISTS idx_consultations_doctor_created ON consultations (doctor_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_consultations_user_created ON consultations (user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_appointments_doctor_date ON appointments (doctor_id, appointment_date, appointment_time)',
+        'CREATE INDEX IF NOT EXISTS idx_appointments_user_date ON appointments (user_id, appointment_date, appointment_time)',
+        'CREATE INDEX IF NOT EXISTS idx_medicine_orders_user_created ON medicine_orders (user_id, created_at)',
+    ]),
+    (2, 'Doctor directory search indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_doctors_available_name ON doctors (available, full_name)',
+        'CREATE INDEX IF NOT EXISTS idx_doctors_specialization ON doctors (specialization, consultation_fee)',
+        'CREATE INDEX IF NOT EXISTS idx_doctors_fee ON doctors (consultation_fee)',
+        'CREATE INDEX IF NOT EXISTS idx_doctors_experience ON doctors (experience_years)',
+        lambda conn: _create_doctor_fts(conn),
+    ]),
+    (3, 'Original file name for content-addressed prescriptions', [
+        'ALTER TABLE medicine_orders ADD COLUMN prescription_name TEXT',
+    ]),
+    (4, 'Background job queue', [
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_after REAL NOT NULL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs (status, run_after)',
+    ]),
+    (5, 'Extracted prescription PDF details', [
+        '''
+        CREATE TABLE IF NOT EXISTS prescription_documents (
+            path TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            page_count INTEGER,
+            title TEXT,
+            author TEXT,
+            text TEXT,
+            thumbnail TEXT,
+            error TEXT,
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (6, 'Slow query log', [
+        '''
+        CREATE TABLE IF NOT EXISTS slow_queries (
+            statement TEXT PRIMARY KEY,
+            parameters TEXT,
+            count INTEGER NOT NULL DEFAULT 0,
+            total_ms REAL NOT NULL DEFAULT 0,
+            max_ms REAL NOT NULL DEFAULT 0,
+            max_rows INTEGER NOT NULL DEFAULT 0,
+            query_plan TEXT,
+            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (7, 'Server-side sessions', [
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)',
+    ]),
+    (8, 'Statistics counters maintained by triggers', [
+        '''
+        CREATE TABLE IF NOT EXISTS stats (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID
+        ''',
+        lambda conn: _create_stats_triggers(conn),
+        lambda conn: rebuild_stats(conn),
+    ]),
+    (9, 'Daily analytics rollups', [
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            source TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            refreshed_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_consultations_daily (
+            day TEXT NOT NULL,
+            doctor_id INTEGER NOT NULL,
+            consultations INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, doctor_id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_appointments_daily (
+            day TEXT NOT NULL,
+            specialization TEXT NOT NULL,
+            appointments INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, specialization)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_orders_daily (
+            day TEXT NOT NULL,
+            town TEXT NOT NULL,
+            zipcode TEXT NOT NULL,
+            orders INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, town, zipcode)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_pending (
+            source TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            items INTEGER NOT NULL DEFAULT 0,
+            oldest TIMESTAMP,
+            PRIMARY KEY (source, bucket)
+        ) WITHOUT ROWID
+        ''',
+        # Pending rows only, so queue ages are read without scanning the tables
+        "CREATE INDEX IF NOT EXISTS idx_consultations_pending ON consultations (created_at) WHERE status = 'pending'",
+        "CREATE INDEX IF NOT EXISTS idx_appointments_pending ON appointments (created_at) WHERE status = 'pending'",
+        "CREATE INDEX IF NOT EXISTS idx_medicine_orders_pending ON medicine_orders (created_at) WHERE status = 'pending'",
+        "CREATE INDEX IF NOT EXISTS idx_contact_messages_unread ON contact_messages (created_at) WHERE status = 'unread'",
+    ]),
+    (10, 'Doctor working hours and appointment slots', [
+        '''
+        CREATE TABLE IF NOT EXISTS doctor_hours (
+            doctor_id INTEGER NOT NULL,
+            weekday INTEGER NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            slot_minutes INTEGER NOT NULL DEFAULT 30,
+            PRIMARY KEY (doctor_id, weekday, start_time)
+        ) WITHOUT ROWID
+        ''',
+        # The primary key is the unique (doctor_id, date, time) index that
+        # makes a slot impossible to book twice
+        '''
+        CREATE TABLE IF NOT EXISTS appointment_slots (
+            doctor_id INTEGER NOT NULL,
+            slot_date TEXT NOT NULL,
+            slot_time TEXT NOT NULL,
+            appointment_id INTEGER,
+            PRIMARY KEY (doctor_id, slot_date, slot_time)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_appointment_slots_free
+        ON appointment_slots (doctor_id, slot_date, slot_time) WHERE appointment_id IS NULL
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS slot_horizon (
+            doctor_id INTEGER PRIMARY KEY,
+            generated_until TEXT NOT NULL
+        )
+        ''',
+        lambda conn: _create_slot_triggers(conn),
+        lambda conn: conn.executemany(
+            'INSERT OR IGNORE INTO doctor_hours SELECT id, ?, ?, ?, ? FROM doctors', DEFAULT_DOCTOR_HOURS),
+    ]),
+    (11, 'Consultation work queue and change log', [
+        f'ALTER TABLE consultations ADD COLUMN priority INTEGER NOT NULL DEFAULT {DEFAULT_PRIORITY}',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_consultations_doctor_queue
+        ON consultations (doctor_id, priority, created_at) WHERE status = 'pending'
+        ''',
+        # One row per consultation, moved to a new seq on every change;
+        # AUTOINCREMENT keeps seq from ever being reused
+        '''
+        CREATE TABLE IF NOT EXISTS consultation_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            consultation_id INTEGER NOT NULL UNIQUE,
+            doctor_id INTEGER,
+            deleted INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_consultation_changes_doctor ON consultation_changes (doctor_id, seq)',
+        lambda conn: _create_change_triggers(conn),
+    ]),
+]
+
+def _create_doctor_fts(conn):
+    """Full-text index over doctor name, qualification and specialization.
+
+    Skipped when this SQLite build has no FTS5; search_doctors() then falls
+    back to LIKE matching.
+    """
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS doctors_fts USING fts5(
+                full_name, qualification, specialization,
+                content='doctors', content_rowid='id'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        return
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS doctors_fts_insert AFTER INSERT ON doctors BEGIN
+            INSERT INTO doctors_fts (rowid, full_name, qualification, specialization)
+            VALUES (new.id, new.full_name, new.qualification, new.specialization);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS doctors_fts_delete AFTER DELETE ON doctors BEGIN
+            INSERT INTO doctors_fts (doctors_fts, rowid, full_name, qualification, specialization)
+            VALUES ('delete', old.id, old.full_name, old.qualification, old.specialization);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS doctors_fts_update AFTER UPDATE OF full_name, qualification, specialization ON doctors BEGIN
+            INSERT INTO doctors_fts (doctors_fts, rowid, full_name, qualification, specialization)
+            VALUES ('delete', old.id, old.full_name, old.qualification, old.specialization);
+            INSERT INTO doctors_fts (rowid, full_name, qualification, specialization)
+            VALUES (new.id, new.full_name, new.qualification, new.specialization);
+        END
+    ''')
+    conn.execute("INSERT INTO doctors_fts (doctors_fts) VALUES ('rebuild')")
+
+def _stat_keys(table, row):
+    """Expressions for the stats keys one row counts towards; NULL keys are skipped.
+
+    '' is the table total, then 'status:<status>', 'doctor:<id>' and
+    'doctor:<id>:status:<status>' where the table has those columns.
+    """
+    columns = STATS_TABLES[table]
+    keys = ["''"]
+    if 'status' in columns:
+        keys.append(f"'status:' || {row}.status")
+    if 'doctor_id' in columns:
+        keys.append(f"'doctor:' || {row}.doctor_id")
+        if 'status' in columns:
+            keys.append(f"'doctor:' || {row}.doctor_id || ':status:' || {row}.status")
+    return keys
+
+def _stats_upsert(table, deltas):
+    """Statement adding each (row alias, delta) pair's keys to the counters"""
+    parts = ' UNION ALL '.join(f'SELECT {key} AS key, {delta} AS delta'
+                               for row, delta in deltas for key in _stat_keys(table, row))
+    return f'''
+        INSERT INTO stats (name, key, value)
+        SELECT '{table}', key, SUM(delta) FROM ({parts})
+        WHERE key IS NOT NULL
+        GROUP BY key
+        ON CONFLICT (name, key) DO UPDATE SET value = value + excluded.value;
+    '''
+
+def _create_stats_triggers(conn):
+    for table, columns in STATS_TABLES.items():
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_insert AFTER INSERT ON {table} BEGIN
+                {_stats_upsert(table, [('new', 1)])}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_delete AFTER DELETE ON {table} BEGIN
+                {_stats_upsert(table, [('old', -1)])}
+            END
+        ''')
+        if columns:
+            changed = ' OR '.join(f'old.{column} IS NOT new.{column}' for column in columns)
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_stats_update
+                AFTER UPDATE OF {', '.join(columns)} ON {table}
+                WHEN {changed} BEGIN
+                    {_stats_upsert(table, [('old', -1), ('new', 1)])}
+                END
+            ''')
+
+def _create_slot_triggers(conn):
+    """Default hours for new doctors; appointments claim and free their slots"""
+    hours = ', '.join(f"(new.id, {weekday}, '{start}', '{end}', {minutes})"
+                      for weekday, start, end, minutes in DEFAULT_DOCTOR_HOURS)
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS doctors_default_hours AFTER INSERT ON doctors BEGIN
+            INSERT OR IGNORE INTO doctor_hours (doctor_id, weekday, start_time, end_time, slot_minutes)
+            VALUES {hours};
+        END
+    ''')
+    # Any insert path (forms, bulk import, generators) takes the slot if it is free
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS appointments_claim_slot AFTER INSERT ON appointments
+        WHEN new.status IS NOT 'cancelled' BEGIN
+            UPDATE appointment_slots SET appointment_id = new.id
+            WHERE doctor_id = new.doctor_id AND slot_date = new.appointment_date
+              AND slot_time = new.appointment_time AND appointment_id IS NULL;
+        END
+    ''')
+    release = '''
+        UPDATE appointment_slots SET appointment_id = NULL
+        WHERE doctor_id = old.doctor_id AND slot_date = old.appointment_date
+          AND slot_time = old.appointment_time AND appointment_id = old.id;
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS appointments_release_slot_cancel
+        AFTER UPDATE OF status ON appointments
+        WHEN new.status = 'cancelled' AND old.status IS NOT 'cancelled' BEGIN
+            {release}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS appointments_release_slot_delete AFTER DELETE ON appointments BEGIN
+            {release}
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS doctors_delete_hours AFTER DELETE ON doctors BEGIN
+            DELETE FROM doctor_hours WHERE doctor_id = old.id;
+            DELETE FROM appointment_slots WHERE doctor_id = old.id AND appointment_id IS NULL;
+            DELETE FROM slot_horizon WHERE doctor_id = old.id;
+        END
+    ''')
+
+def _create_change_triggers(conn):
+    """Record every consultation insert, update and delete in consultation_changes"""
+    for event, row, deleted in (('INSERT', 'new', 0), ('UPDATE', 'new', 0), ('DELETE', 'old', 1)):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS consultations_change_{event.lower()}
+            AFTER {event} ON consultations BEGIN
+                INSERT OR REPLACE INTO consultation_changes (consultation_id, doctor_id, deleted)
+                VALUES ({row}.id, {row}.doctor_id, {deleted});
+            END
+        ''')
+
+def rebuild_stats(conn=None):
+    """Recount every counter from the tables (after bulk changes made with triggers off)"""
+    own = conn is None
+    if own:
+        conn = get_db_connection()
+        conn.execute('BEGIN IMMEDIATE')
+    conn.execute('DELETE FROM stats')
+    for table in STATS_TABLES:
+        conn.execute(f'''
+            INSERT INTO stats (name, key, value)
+            SELECT '{table}', key, COUNT(*) FROM (
+                {' UNION ALL '.join(f'SELECT {key} AS key FROM {table} AS t' for key in _stat_keys(table, 't'))}
+            )
+            WHERE key IS NOT NULL
+            GROUP BY key
+        ''')
+    if own:
+        conn.commit()
+        conn.close()
+
+def _has_table(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (name,)
+    ).fetchone() is not None
+
+def get_schema_version(conn):
+    """Return the schema version stored in the database file"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn):
+    """Apply pending schema migrations, each in its own transaction.
+
+    Each step takes the write lock before re-reading user_version, so
+    workers starting together apply every migration exactly once.
+    """
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            if version <= get_schema_version(conn):
+                # Another process applied it while we waited for the lock
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        applied.append(version)
+        print(f"Applied migration {version}: {description}")
+    return applied
+
+def get_storage_profile():
+    """Return the PRAGMA settings for the active storage profile"""
+    if STORAGE_PROFILE not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile: {STORAGE_PROFILE}")
+    return STORAGE_PROFILES[STORAGE_PROFILE]
+
+def _configure_connection(conn):
+    """Per-connection setup, run once when the connection is opened"""
     conn.row_factory = sqlite3.Row
-    return conn
+    profile = get_storage_profile()
+    conn.execute(f"PRAGMA busy_timeout = {int(profile['busy_timeout'])}")
+    conn.execute(f"PRAGMA synchronous = {profile['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = {int(profile['cache_size'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(profile['mmap_size'])}")
+    conn.execute(f"PRAGMA temp_store = {profile['temp_store']}")
+    # Rows removed by INSERT OR REPLACE must fire delete triggers too, or
+    # the stats counters and doctors_fts drift
+    conn.execute("PRAGMA recursive_triggers = ON")
+
+def _is_lock_error(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+def retry_on_locked(f):
+    """Retry a write helper with exponential backoff while the database is locked"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        delay = WRITE_BACKOFF
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                return f(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not _is_lock_error(e) or attempt == WRITE_RETRIES:
+                    raise
+                time.sleep(delay + random.uniform(0, delay))
+                delay *= 2
+    return decorated_function
+
+def get_db_connection():
+    """Return a pooled database connection; close() gives it back"""
+    return _pool.acquire()
+
+def configure_pool(size):
+    """Change the number of idle connections kept open"""
+    _pool.size = size
+    _pool.clear()
+
+def close_pool():
+    """Close all idle pooled connections"""
+    _pool.clear()
+
+def pool_stats():
+    """Return connection pool counters"""
+    with _pool._lock:
+        stats = dict(_pool.stats)
+    stats['idle'] = _pool._idle.qsize()
+    stats['size'] = _pool.size
+    return stats
+
+class GroupCommitWriter:
+    """Single writer thread that coalesces queued inserts into one transaction.
+
+    A batch is committed once max_batch inserts are waiting or max_delay
+    seconds after its first insert, whichever comes first. Each insert runs
+    in its own savepoint, so one failing row does not fail the others.
+    """
+
+    def __init__(self, max_delay=GROUP_COMMIT_MAX_DELAY, max_batch=GROUP_COMMIT_MAX_BATCH,
+                 queue_size=GROUP_COMMIT_QUEUE_SIZE):
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self.stats = {'batches': 0, 'rows': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, query, params):
+        """Queue one INSERT and wait for its row id"""
+        future = Future()
+        try:
+            self._queue.put((query, params, future), timeout=GROUP_COMMIT_SUBMIT_TIMEOUT)
+        except queue.Full:
+            # Reported as a busy database so retry_on_locked backs off
+            raise sqlite3.OperationalError('database is busy: group commit queue is full')
+        return future.result()
+
+    def stop(self):
+        """Commit what is queued and stop the writer thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            stopping = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch):
+        conn = get_db_connection()
+        done = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for query, params, future in batch:
+                conn.execute('SAVEPOINT group_item')
+                try:
+                    cursor = conn.execute(query, params)
+                except sqlite3.Error as e:
+                    conn.execute('ROLLBACK TO group_item')
+                    future.set_exception(e)
+                    with self._lock:
+                        self.stats['errors'] += 1
+                else:
+                    done.append((future, cursor.lastrowid))
+                conn.execute('RELEASE group_item')
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            conn.close()
+            return
+        conn.close()
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['rows'] += len(done)
+        for future, row_id in done:
+            future.set_result(row_id)
+
+_group_writer = None
+_group_writer_lock = threading.Lock()
+
+def enable_group_commit(**options):
+    """Route form inserts through a GroupCommitWriter (options as its arguments)"""
+    global _group_writer
+    with _group_writer_lock:
+        if _group_writer is None:
+            _group_writer = GroupCommitWriter(**options)
+    return _group_writer
+
+def disable_group_commit():
+    """Flush and stop the group-commit writer; inserts commit individually again"""
+    global _group_writer
+    with _group_writer_lock:
+        writer, _group_writer = _group_writer, None
+    if writer is not None:
+        writer.stop()
+
+def group_commit_stats():
+    """Return group-commit counters, or None when it is disabled"""
+    writer = _group_writer
+    if writer is None:
+        return None
+    with writer._lock:
+        stats = dict(writer.stats)
+    stats['queued'] = writer._queue.qsize()
+    return stats
+
+def _insert(query, params):
+    """Run one INSERT and return its row id.
+
+    Goes through the group-commit writer when it is enabled, otherwise
+    commits on its own pooled connection.
+    """
+    if _group_writer is not None:
+        return _group_writer.submit(query, params)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    conn.commit()
+    row_id = cursor.lastrowid
+    conn.close()
+    return row_id
+
+class DoctorCache:
+    """TTL cache for doctor reference data, stamped with a version number.
+
+    invalidate() bumps the version, so entries loaded before a write are
+    never stored or served afterwards.
+    """
+
+    def __init__(self, ttl=DOCTOR_CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, key, loader):
+        """Return the cached value for key, calling loader() on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == self.version and entry[1] > now:
+                self.stats['hits'] += 1
+                return entry[2]
+            self.stats['misses'] += 1
+            version = self.version
+        value = loader()
+        with self._lock:
+            if version == self.version:
+                self._entries[key] = (version, now + self.ttl, value)
+        return value
+
+    def invalidate(self):
+        """Drop every entry after a doctor row changes"""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self.stats['invalidations'] += 1
+
+_doctor_cache = DoctorCache()
+
+def doctor_cache_stats():
+    """Return doctor cache counters"""
+    with _doctor_cache._lock:
+        stats = dict(_doctor_cache.stats)
+        stats['version'] = _doctor_cache.version
+        stats['entries'] = len(_doctor_cache._entries)
+    return stats
 
 def init_db():
     """Initialize the database with all required tables"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
+    # Journal mode is stored in the database file, so set it once here
+    cursor.execute(f"PRAGMA journal_mode = {get_storage_profile()['journal_mode']}")
+
     # Users table (for patients)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -117,7 +1039,10 @@ def init_db():
 
     conn.commit()
 
-    # Insert sample doctors if none exist
+    migrate(conn)
+
+    # Insert sample doctors if none exist (OR IGNORE: another worker may
+    # be seeding them at the same time)
     cursor.execute('SELECT COUNT(*) FROM doctors')
     if cursor.fetchone()[0] == 0:
         sample_doctors = [
@@ -129,16 +1054,79 @@ def init_db():
         ]
 
         cursor.executemany('''
-            INSERT INTO doctors (username, password, full_name, specialization, email, phone, experience_years, qualification, consultation_fee)
+            INSERT OR IGNORE INTO doctors (username, password, full_name, specialization, email, phone, experience_years, qualification, consultation_fee)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', sample_doctors)
         conn.commit()
+        _doctor_cache.invalidate()
 
     conn.close()
+
+    if GROUP_COMMIT:
+        enable_group_commit()
+
     print("Database initialized successfully!")
 
+# Pagination helpers
+
+def clamp_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Parse a requested page size and keep it within 1..MAX_PAGE_SIZE"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, size):
+    """Decode a cursor from encode_cursor(); returns None if it is invalid"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    # Only scalars can be bound as query parameters
+    if not all(value is None or isinstance(value, (str, int, float)) for value in values):
+        return None
+    return values
+
+def _fetch_keyset(conn, query, params, order_columns, limit=None, cursor=None, descending=True):
+    """Run a newest-first query, optionally one keyset page at a time.
+
+    query must end in a WHERE clause; order_columns are the sort key,
+    most significant first, and must uniquely identify a row.
+    """
+    params = list(params)
+    values = decode_cursor(cursor, len(order_columns))
+    if values:
+        placeholders = ', '.join('?' * len(order_columns))
+        operator = '<' if descending else '>'
+        query += f" AND ({', '.join(order_columns)}) {operator} ({placeholders})"
+        params.extend(values)
+    direction = 'DESC' if descending else 'ASC'
+    query += ' ORDER BY ' + ', '.join(f'{column} {direction}' for column in order_columns)
+
+    if limit is None:
+        return conn.execute(query, params).fetchall()
+
+    rows = conn.execute(query + ' LIMIT ?', params + [limit + 1]).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(*[last[column.split('.')[-1]] for column in order_columns])
+    return Page(rows[:limit], next_cursor)
+
 # Database helper functions
 
+@retry_on_locked
 def create_user(username, password, email=None, phone=None, full_name=None, age=None, gender=None):
     """Create a new user"""
     conn = get_db_connection()
@@ -163,6 +1151,22 @@ def get_user_by_username(username):
     conn.close()
     return user
 
+def get_user_credentials(username):
+    """Get only the columns login needs (id, username, password)"""
+    conn = get_db_connection()
+    user = conn.execute('SELECT id, username, password FROM users WHERE username = ?', (username,)).fetchone()
+    conn.close()
+    return user
+
+@retry_on_locked
+def set_user_password(user_id, password_hash):
+    """Replace a user's stored password hash"""
+    conn = get_db_connection()
+    conn.execute('UPDATE users SET password = ? WHERE id = ?', (password_hash, user_id))
+    conn.commit()
+    conn.close()
+
+@retry_on_locked
 def create_doctor(username, password, full_name, specialization, email=None, phone=None, experience_years=0, qualification='', consultation_fee=500.0):
     """Create a new doctor"""
     conn = get_db_connection()
@@ -175,6 +1179,7 @@ def create_doctor(username, password, full_name, specialization, email=None, pho
         conn.commit()
         doctor_id = cursor.lastrowid
         conn.close()
+        _doctor_cache.invalidate()
         return doctor_id
     except sqlite3.IntegrityError:
         conn.close()
@@ -187,60 +1192,173 @@ def get_doctor_by_username(username):
     conn.close()
     return doctor
 
+def get_doctor_credentials(username):
+    """Get only the columns doctor login needs (id, username, full_name, password)"""
+    conn = get_db_connection()
+    doctor = conn.execute(
+        'SELECT id, username, full_name, password FROM doctors WHERE username = ?', (username,)
+    ).fetchone()
+    conn.close()
+    return doctor
+
+@retry_on_locked
+def set_doctor_password(doctor_id, password_hash):
+    """Replace a doctor's stored password hash"""
+    conn = get_db_connection()
+    conn.execute('UPDATE doctors SET password = ? WHERE id = ?', (password_hash, doctor_id))
+    conn.commit()
+    conn.close()
+    _doctor_cache.invalidate()
+
+# Doctor columns that may be cached; password hashes stay out of the
+# shared cache and are read only through get_doctor_credentials()
+DOCTOR_COLUMNS = ('id, username, full_name, specialization, email, phone, experience_years, '
+                  'qualification, consultation_fee, available, created_at')
+
+def _select_all_doctors(conn):
+    return conn.execute(f'SELECT {DOCTOR_COLUMNS} FROM doctors WHERE available = 1 ORDER BY full_name').fetchall()
+
+def _load_all_doctors():
+    conn = get_db_connection()
+    doctors = _select_all_doctors(conn)
+    conn.close()
+    return doctors
+
 def get_all_doctors():
-    """Get all available doctors"""
+    """Get all available doctors (cached)"""
+    return list(_doctor_cache.get('directory', _load_all_doctors))
+
+def normalize_doctor_name(name):
+    """Normalize a doctor name for lookup: 'Dr. Ravi  Kumar (GP)' -> 'ravi kumar'"""
+    name = re.sub(r'\(.*?\)', ' ', name or '')
+    name = re.sub(r'^\s*dr\.?\s+', '', name, flags=re.IGNORECASE)
+    return ' '.join(name.split()).casefold()
+
+def _build_doctor_index():
+    by_id = {}
+    by_name = {}
+    for doctor in get_all_doctors():
+        by_id[doctor['id']] = doctor
+        by_name.setdefault(normalize_doctor_name(doctor['full_name']), []).append(doctor)
+    return DoctorIndex(by_id, by_name)
+
+def find_doctor(reference):
+    """Resolve an available doctor from an ID or a name.
+
+    Returns None when nothing matches or a name matches several doctors.
+    """
+    index = _doctor_cache.get('index', _build_doctor_index)
+    reference = str(reference or '').strip()
+    if reference.isdigit():
+        return index.by_id.get(int(reference))
+    matches = index.by_name.get(normalize_doctor_name(reference), [])
+    return matches[0] if len(matches) == 1 else None
+
+def _fts_query(text):
+    """Turn free text into an FTS5 prefix query: 'card md' -> '"card"* "md"*'"""
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', text))
+
+def search_doctors(text=None, specialization=None, min_fee=None, max_fee=None,
+                   min_experience=None, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """Search available doctors, ordered by name, one keyset Page at a time"""
+    query = '''
+        SELECT d.id, d.full_name, d.specialization, d.qualification,
+               d.experience_years, d.consultation_fee
+        FROM doctors d
+        WHERE d.available = 1
+    '''
+    params = []
+    if specialization:
+        query += ' AND d.specialization = ?'
+        params.append(specialization)
+    if min_fee is not None:
+        query += ' AND d.consultation_fee >= ?'
+        params.append(min_fee)
+    if max_fee is not None:
+        query += ' AND d.consultation_fee <= ?'
+        params.append(max_fee)
+    if min_experience is not None:
+        query += ' AND d.experience_years >= ?'
+        params.append(min_experience)
+
     conn = get_db_connection()
-    doctors = conn.execute('SELECT * FROM doctors WHERE available = 1 ORDER BY full_name').fetchall()
+    if text and _fts_query(text):
+        if _has_table(conn, 'doctors_fts'):
+            query += ' AND d.id IN (SELECT rowid FROM doctors_fts WHERE doctors_fts MATCH ?)'
+            params.append(_fts_query(text))
+        else:
+            for term in re.findall(r'\w+', text):
+                query += ' AND (d.full_name LIKE ? OR d.qualification LIKE ? OR d.specialization LIKE ?)'
+                params.extend([f'%{term}%'] * 3)
+    doctors = _fetch_keyset(conn, query, params, ('d.full_name', 'd.id'), limit, cursor, descending=False)
     conn.close()
     return doctors
 
-def get_doctor_by_id(doctor_id):
-    """Get doctor by ID"""
+def _load_doctor(doctor_id):
     conn = get_db_connection()
-    doctor = conn.execute('SELECT * FROM doctors WHERE id = ?', (doctor_id,)).fetchone()
+    doctor = conn.execute(f'SELECT {DOCTOR_COLUMNS} FROM doctors WHERE id = ?', (doctor_id,)).fetchone()
     conn.close()
     return doctor
 
+def get_doctor_by_id(doctor_id):
+    """Get doctor by ID (cached)"""
+    return _doctor_cache.get(('doctor', doctor_id), lambda: _load_doctor(doctor_id))
+
+@retry_on_locked
+def set_doctor_availability(doctor_id, available):
+    """Show or hide a doctor in the directory"""
+    conn = get_db_connection()
+    conn.execute('UPDATE doctors SET available = ? WHERE id = ?', (1 if available else 0, doctor_id))
+    conn.commit()
+    conn.close()
+    _doctor_cache.invalidate()
+
+@retry_on_locked
 def create_consultation(user_id, doctor_id, fullname, age, gender, city, service_type, problem):
     """Create a new consultation"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
+    return _insert('''
         INSERT INTO consultations (user_id, doctor_id, fullname, age, gender, city, service_type, problem)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
     ''', (user_id, doctor_id, fullname, age, gender, city, service_type, problem))
-    conn.commit()
-    consultation_id = cursor.lastrowid
-    conn.close()
-    return consultation_id
 
-def get_doctor_consultations(doctor_id):
-    """Get all consultations for a specific doctor"""
-    conn = get_db_connection()
-    consultations = conn.execute('''
+def _select_doctor_consultations(conn, doctor_id, limit=None, cursor=None):
+    return _fetch_keyset(conn, '''
         SELECT c.*, u.username, u.email, u.phone
         FROM consultations c
         LEFT JOIN users u ON c.user_id = u.id
         WHERE c.doctor_id = ?
-        ORDER BY c.created_at DESC
-    ''', (doctor_id,)).fetchall()
+    ''', (doctor_id,), ('c.created_at', 'c.id'), limit, cursor)
+
+def get_doctor_consultations(doctor_id, limit=None, cursor=None):
+    """Get consultations for a specific doctor, newest first.
+
+    Returns all rows, or a Page of at most limit rows when limit is given.
+    """
+    conn = get_db_connection()
+    consultations = _select_doctor_consultations(conn, doctor_id, limit, cursor)
     conn.close()
     return consultations
 
-def get_user_consultations(user_id):
-    """Get all consultations for a specific user"""
-    conn = get_db_connection()
-    consultations = conn.execute('''
+def _select_user_consultations(conn, user_id, limit=None, cursor=None):
+    return _fetch_keyset(conn, '''
         SELECT c.*, d.full_name as doctor_name, d.specialization
         FROM consultations c
         LEFT JOIN doctors d ON c.doctor_id = d.id
         WHERE c.user_id = ?
-        ORDER BY c.created_at DESC
-    ''', (user_id,)).fetchall()
+    ''', (user_id,), ('c.created_at', 'c.id'), limit, cursor)
+
+def get_user_consultations(user_id, limit=None, cursor=None):
+    """Get consultations for a specific user, newest first.
+
+    Returns all rows, or a Page of at most limit rows when limit is given.
+    """
+    conn = get_db_connection()
+    consultations = _select_user_consultations(conn, user_id, limit, cursor)
     conn.close()
     return consultations
 
-def update_consultation(consultation_id, status=None, prescription=None, notes=None):
+@retry_on_locked
+def update_consultation(consultation_id, status=None, prescription=None, notes=None, priority=None):
     """Update consultation details"""
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -257,6 +1375,9 @@ def update_consultation(consultation_id, status=None, prescription=None, notes=N
     if notes:
         updates.append('notes = ?')
         params.append(notes)
+    if priority is not None:
+        updates.append('priority = ?')
+        params.append(priority)
 
     if updates:
         params.append(consultation_id)
@@ -266,6 +1387,53 @@ def update_consultation(consultation_id, status=None, prescription=None, notes=N
 
     conn.close()
 
+def _select_doctor_queue(conn, doctor_id, limit, cursor=None):
+    return _fetch_keyset(conn, '''
+        SELECT c.*, u.username, u.email, u.phone
+        FROM consultations c
+        LEFT JOIN users u ON c.user_id = u.id
+        WHERE c.doctor_id = ? AND c.status = 'pending'
+    ''', (doctor_id,), ('c.priority', 'c.created_at', 'c.id'), limit, cursor, descending=False)
+
+def _select_change_seq(conn, doctor_id):
+    return conn.execute(
+        'SELECT COALESCE(MAX(seq), 0) FROM consultation_changes WHERE doctor_id = ?', (doctor_id,)
+    ).fetchone()[0]
+
+def get_doctor_queue(doctor_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """A doctor's pending consultations, most urgent then oldest first.
+
+    Returns (Page, seq): seq is the doctor's latest change, to poll
+    get_consultation_changes() from. Both come from one read.
+    """
+    conn = get_db_connection()
+    conn.execute('BEGIN')
+    page = _select_doctor_queue(conn, doctor_id, limit, cursor)
+    seq = _select_change_seq(conn, doctor_id)
+    conn.commit()
+    conn.close()
+    return page, seq
+
+def get_consultation_changes(doctor_id, since, limit=MAX_PAGE_SIZE):
+    """Consultations of a doctor changed after change number since, in change order.
+
+    Each row carries its seq and a deleted flag; the consultation
+    columns are NULL for deleted rows.
+    """
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT ch.seq, ch.consultation_id, ch.deleted, c.*, u.username, u.email, u.phone
+        FROM consultation_changes ch
+        LEFT JOIN consultations c ON c.id = ch.consultation_id
+        LEFT JOIN users u ON c.user_id = u.id
+        WHERE ch.doctor_id = ? AND ch.seq > ?
+        ORDER BY ch.seq
+        LIMIT ?
+    ''', (doctor_id, since, limit)).fetchall()
+    conn.close()
+    return rows
+
+@retry_on_locked
 def create_appointment(user_id, doctor_id, appointment_date, appointment_time, reason):
     """Create a new appointment"""
     conn = get_db_connection()
@@ -279,68 +1447,206 @@ def create_appointment(user_id, doctor_id, appointment_date, appointment_time, r
     conn.close()
     return appointment_id
 
-def get_doctor_appointments(doctor_id):
-    """Get all appointments for a specific doctor"""
-    conn = get_db_connection()
-    appointments = conn.execute('''
+def _select_doctor_appointments(conn, doctor_id, limit=None, cursor=None):
+    return _fetch_keyset(conn, '''
         SELECT a.*, u.username, u.full_name as patient_name, u.email, u.phone
         FROM appointments a
         LEFT JOIN users u ON a.user_id = u.id
         WHERE a.doctor_id = ?
-        ORDER BY a.appointment_date DESC, a.appointment_time DESC
-    ''', (doctor_id,)).fetchall()
+    ''', (doctor_id,), ('a.appointment_date', 'a.appointment_time', 'a.id'), limit, cursor)
+
+def get_doctor_appointments(doctor_id, limit=None, cursor=None):
+    """Get appointments for a specific doctor, latest date first.
+
+    Returns all rows, or a Page of at most limit rows when limit is given.
+    """
+    conn = get_db_connection()
+    appointments = _select_doctor_appointments(conn, doctor_id, limit, cursor)
     conn.close()
     return appointments
 
-def get_user_appointments(user_id):
-    """Get all appointments for a specific user"""
-    conn = get_db_connection()
-    appointments = conn.execute('''
+def _select_user_appointments(conn, user_id, limit=None, cursor=None):
+    return _fetch_keyset(conn, '''
         SELECT a.*, d.full_name as doctor_name, d.specialization, d.consultation_fee
         FROM appointments a
         LEFT JOIN doctors d ON a.doctor_id = d.id
         WHERE a.user_id = ?
-        ORDER BY a.appointment_date DESC, a.appointment_time DESC
-    ''', (user_id,)).fetchall()
+    ''', (user_id,), ('a.appointment_date', 'a.appointment_time', 'a.id'), limit, cursor)
+
+def get_user_appointments(user_id, limit=None, cursor=None):
+    """Get appointments for a specific user, latest date first.
+
+    Returns all rows, or a Page of at most limit rows when limit is given.
+    """
+    conn = get_db_connection()
+    appointments = _select_user_appointments(conn, user_id, limit, cursor)
     conn.close()
     return appointments
 
-def create_medicine_order(user_id, fullname, phone, zipcode, town, landmark, prescription_file):
+@retry_on_locked
+def create_medicine_order(user_id, fullname, phone, zipcode, town, landmark, prescription_file, prescription_name=None):
     """Create a new medicine order"""
+    return _insert('''
+        INSERT INTO medicine_orders (user_id, fullname, phone, zipcode, town, landmark, prescription_file, prescription_name)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, fullname, phone, zipcode, town, landmark, prescription_file, prescription_name))
+
+def _select_user_orders(conn, user_id, limit=None, cursor=None):
+    return _fetch_keyset(conn, '''
+        SELECT m.*, p.page_count, substr(p.text, 1, 200) as text_excerpt, p.thumbnail
+        FROM medicine_orders m
+        LEFT JOIN prescription_documents p ON p.path = m.prescription_file
+        WHERE m.user_id = ?
+    ''', (user_id,), ('m.created_at', 'm.id'), limit, cursor)
+
+def get_user_orders(user_id, limit=None, cursor=None):
+    """Get medicine orders for a specific user, newest first.
+
+    Returns all rows, or a Page of at most limit rows when limit is given.
+    """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO medicine_orders (user_id, fullname, phone, zipcode, town, landmark, prescription_file)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, fullname, phone, zipcode, town, landmark, prescription_file))
-    conn.commit()
-    order_id = cursor.lastrowid
+    orders = _select_user_orders(conn, user_id, limit, cursor)
     conn.close()
-    return order_id
+    return orders
 
-def get_user_orders(user_id):
-    """Get all medicine orders for a specific user"""
+def get_order_queue(status='pending', limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """Orders with one status for triage, oldest first, with their prescription details.
+
+    status must be one of ORDER_STATUSES; it is written into the query so
+    pending orders are read through the partial pending index.
+    """
+    if status not in ORDER_STATUSES:
+        raise ValueError(f"Unknown order status: {status}")
     conn = get_db_connection()
-    orders = conn.execute('''
-        SELECT * FROM medicine_orders
-        WHERE user_id = ?
-        ORDER BY created_at DESC
-    ''', (user_id,)).fetchall()
+    orders = _fetch_keyset(conn, f'''
+        SELECT m.*, u.username as patient_username,
+               p.page_count, substr(p.text, 1, 200) as text_excerpt, p.thumbnail, p.error
+        FROM medicine_orders m
+        LEFT JOIN users u ON u.id = m.user_id
+        LEFT JOIN prescription_documents p ON p.path = m.prescription_file
+        WHERE m.status = '{status}'
+    ''', (), ('m.created_at', 'm.id'), limit, cursor, descending=False)
     conn.close()
     return orders
 
+@retry_on_locked
+def update_order_status(order_id, status):
+    """Set a medicine order's status; returns False if the order does not exist"""
+    if status not in ORDER_STATUSES:
+        raise ValueError(f"Unknown order status: {status}")
+    conn = get_db_connection()
+    cursor = conn.execute('UPDATE medicine_orders SET status = ? WHERE id = ?', (status, order_id))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount == 1
+
+def user_owns_prescription(user_id, prescription_file):
+    """Check whether one of the user's orders references the stored file"""
+    conn = get_db_connection()
+    row = conn.execute('''
+        SELECT 1 FROM medicine_orders
+        WHERE user_id = ? AND prescription_file = ?
+        LIMIT 1
+    ''', (user_id, prescription_file)).fetchone()
+    conn.close()
+    return row is not None
+
+def get_prescription_document(path):
+    """Get extracted details for a stored prescription file"""
+    conn = get_db_connection()
+    document = conn.execute('SELECT * FROM prescription_documents WHERE path = ?', (path,)).fetchone()
+    conn.close()
+    return document
+
+@retry_on_locked
+def save_prescription_document(path, sha256, page_count, title, author, text, thumbnail, error=None):
+    """Store extracted details for a prescription file"""
+    conn = get_db_connection()
+    conn.execute('''
+        INSERT OR REPLACE INTO prescription_documents (path, sha256, page_count, title, author, text, thumbnail, error)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (path, sha256, page_count, title, author, text, thumbnail, error))
+    conn.commit()
+    conn.close()
+
+def get_user_dashboard(user_id, limit=DEFAULT_PAGE_SIZE, cursors=None):
+    """Load every section of the patient dashboard on one connection.
+
+    All queries run inside a single read transaction so the sections come
+    from the same snapshot. cursors maps a section name to its page cursor.
+    """
+    cursors = cursors or {}
+    conn = get_db_connection()
+    conn.execute('BEGIN')
+    dashboard = {
+        'doctors': list(_doctor_cache.get('directory', lambda: _select_all_doctors(conn))),
+        'consultations': _select_user_consultations(conn, user_id, limit, cursors.get('consultations')),
+        'appointments': _select_user_appointments(conn, user_id, limit, cursors.get('appointments')),
+        'orders': _select_user_orders(conn, user_id, limit, cursors.get('orders')),
+    }
+    conn.commit()
+    conn.close()
+    return dashboard
+
+def get_doctor_dashboard(doctor_id, limit=DEFAULT_PAGE_SIZE, cursors=None):
+    """Load every section of the doctor dashboard on one connection"""
+    cursors = cursors or {}
+    conn = get_db_connection()
+    conn.execute('BEGIN')
+    dashboard = {
+        'consultations': _select_doctor_consultations(conn, doctor_id, limit, cursors.get('consultations')),
+        'appointments': _select_doctor_appointments(conn, doctor_id, limit, cursors.get('appointments')),
+        'queue': _select_doctor_queue(conn, doctor_id, limit),
+        'counts': _select_doctor_counts(conn, doctor_id),
+        'seq': _select_change_seq(conn, doctor_id),
+    }
+    conn.commit()
+    conn.close()
+    return dashboard
+
+def get_table_counts():
+    """Row count of every table in STATS_TABLES, read from the stats counters"""
+    conn = get_db_connection()
+    rows = conn.execute("SELECT name, value FROM stats WHERE key = ''").fetchall()
+    conn.close()
+    counts = dict.fromkeys(STATS_TABLES, 0)
+    counts.update((row['name'], row['value']) for row in rows)
+    return counts
+
+def get_stats(table):
+    """All counters of one table as {key: value} ('' is the total)"""
+    conn = get_db_connection()
+    rows = conn.execute('SELECT key, value FROM stats WHERE name = ? AND value != 0', (table,)).fetchall()
+    conn.close()
+    return {row['key']: row['value'] for row in rows}
+
+def _select_doctor_counts(conn, doctor_id):
+    prefix = f'doctor:{int(doctor_id)}'
+    rows = conn.execute('''
+        SELECT name, key, value FROM stats
+        WHERE name IN ('consultations', 'appointments')
+          AND (key = ? OR (key >= ? AND key < ?))
+    ''', (prefix, prefix + ':status:', prefix + ':status;')).fetchall()
+    counts = {'consultations': {'total': 0}, 'appointments': {'total': 0}}
+    for row in rows:
+        status = row['key'][len(prefix) + len(':status:'):] if row['key'] != prefix else 'total'
+        counts[row['name']][status] = row['value']
+    return counts
+
+def get_doctor_counts(doctor_id):
+    """Consultation and appointment totals for a doctor, overall and per status"""
+    conn = get_db_connection()
+    counts = _select_doctor_counts(conn, doctor_id)
+    conn.close()
+    return counts
+
+@retry_on_locked
 def create_contact_message(name, email, message):
     """Create a new contact message"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
+    return _insert('''
         INSERT INTO contact_messages (name, email, message)
         VALUES (?, ?, ?)
     ''', (name, email, message))
-    conn.commit()
-    message_id = cursor.lastrowid
-    conn.close()
-    return message_id
 
 if __name__ == '__main__':
     init_db()
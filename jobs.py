@@ -0,0 +1,245 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import database as db
+
+# Worker threads that run job handlers
+WORKERS = int(os.environ.get('HEALTHCONNECT_JOB_WORKERS', 2))
+
+# Jobs held in memory for the workers; when full, new jobs wait in the
+# jobs table and the poller hands them out as workers free up
+QUEUE_SIZE = int(os.environ.get('HEALTHCONNECT_JOB_QUEUE_SIZE', 100))
+
+# Attempts before a job is marked failed, and the first retry delay
+# in seconds (doubled after each failure)
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 2.0
+
+# Seconds between scans of the jobs table for due or overflowed jobs
+POLL_INTERVAL = 5.0
+
+# Running jobs untouched for this many minutes are assumed abandoned
+STALE_MINUTES = 10
+
+# Seconds between poller passes that requeue abandoned jobs and prune
+# finished ones
+MAINTENANCE_INTERVAL = 60.0
+
+# Days a done job is kept before it is deleted (failed jobs are kept),
+# and rows deleted per transaction
+DONE_RETENTION_DAYS = int(os.environ.get('HEALTHCONNECT_JOB_RETENTION_DAYS', 7))
+PRUNE_BATCH = 1000
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_threads = []
+_stop = threading.Event()
+
+# Jobs this process is running, so recovery never requeues them
+_running = set()
+_running_lock = threading.Lock()
+
+def handler(name):
+    """Register a function as the handler for jobs called name"""
+    def decorator(f):
+        _handlers[name] = f
+        return f
+    return decorator
+
+@db.retry_on_locked
+def enqueue(name, payload=None, max_attempts=MAX_ATTEMPTS):
+    """Store a job durably and hand it to a worker if there is room.
+
+    Never blocks the caller: a full in-memory queue only delays the job
+    until the next poll.
+    """
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO jobs (name, payload, max_attempts, run_after)
+        VALUES (?, ?, ?, ?)
+    ''', (name, json.dumps(payload or {}), max_attempts, time.time()))
+    conn.commit()
+    job_id = cursor.lastrowid
+    conn.close()
+    _offer(job_id)
+    return job_id
+
+def _offer(job_id):
+    try:
+        _queue.put_nowait(job_id)
+        return True
+    except queue.Full:
+        return False
+
+@db.retry_on_locked
+def _claim(job_id):
+    """Atomically mark a pending job as running; returns its row or None"""
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status = 'pending'
+    ''', (job_id,))
+    conn.commit()
+    job = None
+    if cursor.rowcount == 1:
+        job = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    conn.close()
+    return job
+
+@db.retry_on_locked
+def _finish(job, error=None):
+    conn = db.get_db_connection()
+    if error is None:
+        conn.execute('''
+            UPDATE jobs SET status = 'done', last_error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (job['id'],))
+    elif job['attempts'] >= job['max_attempts']:
+        conn.execute('''
+            UPDATE jobs SET status = 'failed', last_error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (error, job['id']))
+    else:
+        delay = RETRY_DELAY * (2 ** (job['attempts'] - 1))
+        conn.execute('''
+            UPDATE jobs SET status = 'pending', last_error = ?, run_after = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (error, time.time() + delay, job['id']))
+    conn.commit()
+    conn.close()
+
+def run_job(job_id):
+    """Claim and run one job; returns False if another worker had it"""
+    with _running_lock:
+        _running.add(job_id)
+    try:
+        job = _claim(job_id)
+        if job is None:
+            return False
+        f = _handlers.get(job['name'])
+        try:
+            if f is None:
+                raise LookupError(f"No handler registered for job '{job['name']}'")
+            f(json.loads(job['payload']))
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job['id'], job['name'])
+            _finish(job, f"{type(e).__name__}: {e}")
+        else:
+            _finish(job)
+        return True
+    finally:
+        with _running_lock:
+            _running.discard(job_id)
+
+def _worker():
+    while not _stop.is_set():
+        try:
+            job_id = _queue.get(timeout=1.0)
+        except queue.Empty:
+            continue
+        try:
+            run_job(job_id)
+        except Exception:
+            logger.exception("Job worker error")
+        finally:
+            _queue.task_done()
+
+def _due_jobs(limit):
+    conn = db.get_db_connection()
+    rows = conn.execute('''
+        SELECT id FROM jobs
+        WHERE status = 'pending' AND run_after <= ?
+        ORDER BY run_after
+        LIMIT ?
+    ''', (time.time(), limit)).fetchall()
+    conn.close()
+    return [row['id'] for row in rows]
+
+def _poller():
+    last_maintenance = time.monotonic()
+    while not _stop.wait(POLL_INTERVAL):
+        try:
+            if time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+                last_maintenance = time.monotonic()
+                _recover()
+                _prune()
+            for job_id in _due_jobs(QUEUE_SIZE - _queue.qsize()):
+                if not _offer(job_id):
+                    break
+        except Exception:
+            logger.exception("Job poller error")
+
+@db.retry_on_locked
+def _recover():
+    """Requeue jobs left running by a process that exited mid-job.
+
+    Runs at start and on the poller's maintenance pass, so jobs of a
+    worker that crashed and restarted quickly are picked up once stale.
+    """
+    with _running_lock:
+        running = list(_running)
+    conn = db.get_db_connection()
+    conn.execute(f'''
+        UPDATE jobs SET status = 'pending', run_after = ?
+        WHERE status = 'running' AND updated_at < datetime('now', ?)
+          AND id NOT IN ({', '.join('?' * len(running))})
+    ''', (time.time(), f'-{STALE_MINUTES} minutes', *running))
+    conn.commit()
+    conn.close()
+
+@db.retry_on_locked
+def _prune():
+    """Delete done jobs older than DONE_RETENTION_DAYS, in small batches"""
+    conn = db.get_db_connection()
+    while True:
+        cursor = conn.execute('''
+            DELETE FROM jobs WHERE id IN (
+                SELECT id FROM jobs
+                WHERE status = 'done' AND updated_at < datetime('now', ?)
+                LIMIT ?
+            )
+        ''', (f'-{DONE_RETENTION_DAYS} days', PRUNE_BATCH))
+        conn.commit()
+        if cursor.rowcount < PRUNE_BATCH:
+            break
+    conn.close()
+
+def start(workers=WORKERS):
+    """Start the worker threads and the poller (idempotent)"""
+    if _threads:
+        return
+    _stop.clear()
+    _recover()
+    _prune()
+    for i in range(workers):
+        _threads.append(threading.Thread(target=_worker, name=f'job-worker-{i}', daemon=True))
+    _threads.append(threading.Thread(target=_poller, name='job-poller', daemon=True))
+    for thread in _threads:
+        thread.start()
+    for job_id in _due_jobs(QUEUE_SIZE):
+        if not _offer(job_id):
+            break
+
+def stop(timeout=5.0):
+    """Stop all job threads, letting running handlers finish"""
+    _stop.set()
+    for thread in _threads:
+        thread.join(timeout)
+    _threads.clear()
+
+def job_stats():
+    """Return job counts by status and the in-memory queue depth"""
+    conn = db.get_db_connection()
+    rows = conn.execute('SELECT status, COUNT(*) AS count FROM jobs GROUP BY status').fetchall()
+    conn.close()
+    stats = {row['status']: row['count'] for row in rows}
+    stats['queued'] = _queue.qsize()
+    return stats
@@ -0,0 +1,135 @@
+import threading
+
+import database as db
+
+# Histogram buckets in seconds, shared by request and statement timings
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+INF_BUCKET = 'le="+Inf"'
+
+_lock = threading.Lock()
+_metrics = []
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Counter:
+    """Monotonic total per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, amount=1, *label_values):
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in sorted(self._values.items()):
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {value}'
+
+class Histogram:
+    """Bucketed distribution per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        _metrics.append(self)
+
+    def observe(self, value, *label_values):
+        with _lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    def samples(self):
+        for label_values, (counts, count, total) in sorted(self._values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labels, label_values, f'le="{bound}"')
+                yield f'{self.name}_bucket{labels} {bucket_count}'
+            yield f'{self.name}_bucket{_format_labels(self.labels, label_values, INF_BUCKET)} {count}'
+            yield f'{self.name}_sum{_format_labels(self.labels, label_values)} {total}'
+            yield f'{self.name}_count{_format_labels(self.labels, label_values)} {count}'
+
+request_duration = Histogram(
+    'healthconnect_request_duration_seconds', 'Time spent handling a request',
+    ('method', 'route', 'status'))
+request_queries = Counter(
+    'healthconnect_request_sql_queries_total', 'SQL statements run while handling requests', ('route',))
+request_rows = Counter(
+    'healthconnect_request_sql_rows_total', 'Rows returned or changed by SQL during requests', ('route',))
+request_phase_seconds = Counter(
+    'healthconnect_request_phase_seconds_total', 'Request time by phase (sql, render, session)',
+    ('route', 'phase'))
+statement_duration = Histogram(
+    'healthconnect_sql_statement_duration_seconds', 'Time to run one SQL statement and fetch its rows',
+    ('operation',))
+statement_rows = Counter(
+    'healthconnect_sql_rows_total', 'Rows returned or changed by SQL statements', ('operation',))
+
+@db.add_statement_observer
+def observe_statement(sql, parameters, seconds, rows):
+    """Record one finished statement, labelled by its leading keyword"""
+    words = sql.split(None, 1)
+    operation = words[0].lower() if words else 'unknown'
+    statement_duration.observe(seconds, operation)
+    statement_rows.inc(rows, operation)
+
+def observe_request(method, route, status, seconds, sql=None, render_seconds=0.0, session_seconds=0.0):
+    """Record one finished request; sql is the query tracking totals"""
+    request_duration.observe(seconds, method, route, str(status))
+    if sql is not None:
+        request_queries.inc(sql['queries'], route)
+        request_rows.inc(sql['rows'], route)
+        request_phase_seconds.inc(sql['seconds'], route, 'sql')
+    if render_seconds:
+        request_phase_seconds.inc(render_seconds, route, 'render')
+    if session_seconds:
+        request_phase_seconds.inc(session_seconds, route, 'session')
+
+def server_timing(seconds, sql=None, render_seconds=0.0, session_seconds=0.0):
+    """Build a Server-Timing header value (durations in milliseconds)"""
+    parts = []
+    if sql is not None:
+        parts.append(f'sql;dur={sql["seconds"] * 1000:.2f};desc="{sql["queries"]} queries"')
+    parts.append(f'render;dur={render_seconds * 1000:.2f}')
+    parts.append(f'session;dur={session_seconds * 1000:.2f}')
+    parts.append(f'app;dur={seconds * 1000:.2f}')
+    return ', '.join(parts)
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        for metric in _metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+    pool = db.pool_stats()
+    for key in ('hits', 'misses', 'returned', 'discarded'):
+        lines.append(f'# TYPE healthconnect_db_pool_{key}_total counter')
+        lines.append(f'healthconnect_db_pool_{key}_total {pool[key]}')
+    lines.append('# TYPE healthconnect_db_pool_idle gauge')
+    lines.append(f'healthconnect_db_pool_idle {pool["idle"]}')
+    return '\n'.join(lines) + '\n'
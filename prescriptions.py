@@ -0,0 +1,148 @@
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import database as db
+import storage
+
+# Optional PDF libraries: pypdf for text and metadata, PyMuPDF for
+# thumbnails (and text when pypdf is missing). Without either, only the
+# page count is read from the raw file.
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+try:
+    import pymupdf
+except ImportError:
+    try:
+        import fitz as pymupdf
+    except ImportError:
+        pymupdf = None
+
+# Worker processes for PDF analysis (CPU bound, so one per core)
+WORKERS = int(os.environ.get('HEALTHCONNECT_PDF_WORKERS', os.cpu_count() or 1))
+
+# Seconds to wait for one document before giving up (the job is retried)
+TIMEOUT = 120
+
+# Characters of extracted text kept per document
+TEXT_LIMIT = 20000
+
+# Thumbnail width in pixels and sub-directory of the upload folder
+THUMBNAIL_WIDTH = 160
+THUMBNAIL_DIR = 'thumbnails'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _count_pages(data):
+    return len(re.findall(rb'/Type\s*/Page(?![a-zA-Z])', data)) or None
+
+def _read_pdf(path, thumbnail_path, result):
+    if pypdf is not None:
+        reader = pypdf.PdfReader(path)
+        result['page_count'] = len(reader.pages)
+        if reader.metadata:
+            result['title'] = reader.metadata.title
+            result['author'] = reader.metadata.author
+        text = []
+        length = 0
+        for page in reader.pages:
+            text.append(page.extract_text() or '')
+            length += len(text[-1])
+            if length >= TEXT_LIMIT:
+                break
+        result['text'] = '\n'.join(text)[:TEXT_LIMIT]
+
+    if pymupdf is not None:
+        with pymupdf.open(path) as doc:
+            if result['page_count'] is None:
+                result['page_count'] = doc.page_count
+                result['title'] = doc.metadata.get('title') or None
+                result['author'] = doc.metadata.get('author') or None
+                result['text'] = ''.join(page.get_text() for page in doc)[:TEXT_LIMIT]
+            if doc.page_count:
+                page = doc[0]
+                zoom = THUMBNAIL_WIDTH / page.rect.width
+                os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+                page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom)).save(thumbnail_path)
+                result['thumbnail'] = True
+
+def analyze_pdf(path, thumbnail_path):
+    """Read page count, metadata and text from a PDF and render a thumbnail.
+
+    Runs in a worker process and returns a dict of plain values. A file
+    the libraries cannot parse is reported in 'error' rather than raised,
+    since retrying would not help.
+    """
+    result = {'page_count': None, 'title': None, 'author': None, 'text': None,
+              'thumbnail': False, 'error': None}
+    try:
+        _read_pdf(path, thumbnail_path, result)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+
+    if result['page_count'] is None:
+        with open(path, 'rb') as f:
+            result['page_count'] = _count_pages(f.read())
+
+    return result
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: never fork the multi-threaded web process
+            context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=context)
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def shutdown():
+    """Stop the worker processes"""
+    _reset_pool()
+
+def thumbnail_path(sha256):
+    """Thumbnail location relative to the upload folder"""
+    return os.path.join(THUMBNAIL_DIR, sha256[:2], sha256 + '.png').replace(os.sep, '/')
+
+def process_prescription(relative_path, upload_root):
+    """Analyze a stored prescription PDF once and save the results.
+
+    Files are content-addressed, so a PDF uploaded many times is analyzed
+    only on its first upload.
+    """
+    sha256 = storage.content_hash(relative_path or '')
+    if sha256 is None or not relative_path.lower().endswith('.pdf'):
+        return None
+    if db.get_prescription_document(relative_path) is not None:
+        return None
+
+    thumbnail = thumbnail_path(sha256)
+    future = _get_pool().submit(
+        analyze_pdf,
+        os.path.join(upload_root, relative_path),
+        os.path.join(upload_root, thumbnail),
+    )
+    try:
+        result = future.result(timeout=TIMEOUT)
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
+
+    db.save_prescription_document(
+        relative_path, sha256, result['page_count'], result['title'], result['author'],
+        result['text'], thumbnail if result['thumbnail'] else None, result['error'],
+    )
+    return result
@@ -0,0 +1,220 @@
+import logging
+import os
+import secrets
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+
+import database as db
+
+# Where sessions live: 'cookie' (Flask's signed cookies), 'sqlite' (the
+# sessions table, shared by every process) or 'memory' (this process only)
+BACKEND = os.environ.get('HEALTHCONNECT_SESSION_BACKEND', 'cookie')
+
+# Seconds an idle server-side session is kept
+TTL = int(os.environ.get('HEALTHCONNECT_SESSION_TTL', 24 * 60 * 60))
+
+# Session keys that identify who is logged in; a change of any of them
+# moves the session to a fresh id (no session fixation)
+IDENTITY_KEYS = ('user_type', 'user_id', 'doctor_id')
+
+# Seconds between sweeps that delete expired sessions, and rows per
+# DELETE so a sweep never holds the write lock for long
+SWEEP_INTERVAL = 300.0
+SWEEP_BATCH = 1000
+
+logger = logging.getLogger(__name__)
+
+class ServerSideSession(SecureCookieSession):
+    """Session data loaded from a store; the cookie holds only its id"""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.identity = self.current_identity()
+
+    def current_identity(self):
+        return tuple(dict.get(self, key) for key in IDENTITY_KEYS)
+
+class MemorySessionStore:
+    """Sessions in a dict; only for a single worker process"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid, now):
+        with self._lock:
+            entry = self._sessions.get(sid)
+        if entry is None or entry[1] <= now:
+            return None
+        return entry
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._sessions[sid] = (data, expires_at)
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is not None:
+                self._sessions[sid] = (entry[0], expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def sweep(self, now):
+        """Drop every expired session; returns how many"""
+        with self._lock:
+            live = {sid: entry for sid, entry in self._sessions.items() if entry[1] > now}
+            removed = len(self._sessions) - len(live)
+            self._sessions = live
+        return removed
+
+class SQLiteSessionStore:
+    """Sessions in the sessions table, shared by every worker process"""
+
+    def load(self, sid, now):
+        conn = db.get_db_connection()
+        row = conn.execute(
+            'SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at > ?', (sid, now)
+        ).fetchone()
+        conn.close()
+        return (row['data'], row['expires_at']) if row else None
+
+    @db.retry_on_locked
+    def save(self, sid, data, expires_at):
+        conn = db.get_db_connection()
+        conn.execute('''
+            INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+        ''', (sid, data, expires_at))
+        conn.commit()
+        conn.close()
+
+    @db.retry_on_locked
+    def touch(self, sid, expires_at):
+        conn = db.get_db_connection()
+        conn.execute('UPDATE sessions SET expires_at = ? WHERE id = ?', (expires_at, sid))
+        conn.commit()
+        conn.close()
+
+    @db.retry_on_locked
+    def delete(self, sid):
+        conn = db.get_db_connection()
+        conn.execute('DELETE FROM sessions WHERE id = ?', (sid,))
+        conn.commit()
+        conn.close()
+
+    def sweep(self, now):
+        """Delete expired sessions in batches; returns how many"""
+        removed = 0
+        conn = db.get_db_connection()
+        try:
+            while True:
+                cursor = conn.execute('''
+                    DELETE FROM sessions WHERE id IN (
+                        SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?
+                    )
+                ''', (now, SWEEP_BATCH))
+                conn.commit()
+                removed += cursor.rowcount
+                if cursor.rowcount < SWEEP_BATCH:
+                    return removed
+        finally:
+            conn.close()
+
+class ServerSideSessionInterface(SessionInterface):
+    """Keeps session data in a store and only a random id in the cookie.
+
+    The id is 256 random bits, so it is not signed: nothing needs to be
+    HMAC'd or serialized into the cookie on each response. Unchanged
+    sessions are not rewritten; their expiry is pushed back at most once
+    per half TTL.
+    """
+
+    serializer = TaggedJSONSerializer()
+    session_class = ServerSideSession
+
+    def __init__(self, store, ttl=TTL):
+        self.store = store
+        self.ttl = ttl
+        self._next_sweep = time.monotonic() + SWEEP_INTERVAL
+        self._sweep_lock = threading.Lock()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.store.load(sid, time.time())
+            if entry is not None:
+                data, expires_at = entry
+                return self.session_class(self.serializer.loads(data), sid, expires_at)
+        return self.session_class(sid=secrets.token_urlsafe(32))
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        now = time.time()
+        self._maybe_sweep()
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add('Cookie')
+            return
+
+        expires_at = now + self.ttl
+        logged_in_as_someone_else = session.current_identity() != session.identity
+        if session.modified and session.expires_at is not None and logged_in_as_someone_else:
+            self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.expires_at = None
+        if session.modified or session.expires_at is None:
+            self.store.save(session.sid, self.serializer.dumps(dict(session)), expires_at)
+        elif session.expires_at - now < self.ttl / 2:
+            self.store.touch(session.sid, expires_at)
+        else:
+            return
+
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                            httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite)
+        response.vary.add('Cookie')
+
+    def _maybe_sweep(self):
+        if time.monotonic() < self._next_sweep or not self._sweep_lock.acquire(blocking=False):
+            return
+        self._next_sweep = time.monotonic() + SWEEP_INTERVAL
+        threading.Thread(target=self._sweep, name='session-sweep', daemon=True).start()
+
+    def _sweep(self):
+        try:
+            removed = self.store.sweep(time.time())
+            if removed:
+                logger.info('Expired %d sessions', removed)
+        except Exception:
+            logger.exception('Session sweep failed')
+        finally:
+            self._sweep_lock.release()
+
+def make_store(backend=BACKEND):
+    """Return the session store for a backend name, or None for cookies"""
+    if backend == 'cookie':
+        return None
+    if backend == 'sqlite':
+        return SQLiteSessionStore()
+    if backend == 'memory':
+        return MemorySessionStore()
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,187 @@
+import datetime
+import os
+
+import database as db
+
+# Days ahead that appointment slots are generated and bookable
+SLOT_DAYS = int(os.environ.get('HEALTHCONNECT_SLOT_DAYS', 30))
+
+# Free slots offered on the booking page
+DEFAULT_FREE_SLOTS = 12
+
+class SlotUnavailable(Exception):
+    """Raised when a slot is taken, outside working hours or the patient is busy"""
+
+def _today():
+    return datetime.date.today()
+
+def _slot_times(start, end, minutes):
+    """'HH:MM' start times of the slots that fit between start and end"""
+    current = datetime.datetime.strptime(start, '%H:%M')
+    last = datetime.datetime.strptime(end, '%H:%M') - datetime.timedelta(minutes=minutes)
+    while current <= last:
+        yield current.strftime('%H:%M')
+        current += datetime.timedelta(minutes=minutes)
+
+def get_doctor_hours(doctor_id):
+    """A doctor's working-hours template, by weekday (Monday = 0)"""
+    conn = db.get_db_connection()
+    rows = conn.execute('''
+        SELECT weekday, start_time, end_time, slot_minutes FROM doctor_hours
+        WHERE doctor_id = ?
+        ORDER BY weekday, start_time
+    ''', (doctor_id,)).fetchall()
+    conn.close()
+    return rows
+
+def _generate(conn, doctor_id, first, last):
+    """Insert the free slots of [first, last] from the doctor's template"""
+    template = conn.execute(
+        'SELECT weekday, start_time, end_time, slot_minutes FROM doctor_hours WHERE doctor_id = ?', (doctor_id,)
+    ).fetchall()
+    rows = []
+    day = first
+    while day <= last:
+        for hours in template:
+            if hours['weekday'] == day.weekday():
+                rows.extend((doctor_id, day.isoformat(), time)
+                            for time in _slot_times(hours['start_time'], hours['end_time'], hours['slot_minutes']))
+        day += datetime.timedelta(days=1)
+    conn.executemany('''
+        INSERT OR IGNORE INTO appointment_slots (doctor_id, slot_date, slot_time) VALUES (?, ?, ?)
+    ''', rows)
+    # Appointments booked before the slots existed keep their times
+    conn.execute('''
+        UPDATE appointment_slots SET appointment_id = (
+            SELECT MIN(a.id) FROM appointments a
+            WHERE a.doctor_id = appointment_slots.doctor_id
+              AND a.appointment_date = appointment_slots.slot_date
+              AND a.appointment_time = appointment_slots.slot_time
+              AND a.status IS NOT 'cancelled'
+        )
+        WHERE doctor_id = ? AND slot_date BETWEEN ? AND ? AND appointment_id IS NULL
+    ''', (doctor_id, first.isoformat(), last.isoformat()))
+    conn.execute('''
+        INSERT INTO slot_horizon (doctor_id, generated_until) VALUES (?, ?)
+        ON CONFLICT (doctor_id) DO UPDATE SET generated_until = excluded.generated_until
+    ''', (doctor_id, last.isoformat()))
+
+@db.retry_on_locked
+def ensure_slots(doctor_id, days=SLOT_DAYS):
+    """Generate the doctor's slots through today + days if not done yet.
+
+    Slots are extended in one write once the horizon is half used up,
+    so most calls are a single primary-key read.
+    """
+    today = _today()
+    last = today + datetime.timedelta(days=days)
+    conn = db.get_db_connection()
+    try:
+        row = conn.execute('SELECT generated_until FROM slot_horizon WHERE doctor_id = ?', (doctor_id,)).fetchone()
+        if row and row['generated_until'] >= (today + datetime.timedelta(days=days // 2)).isoformat():
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT generated_until FROM slot_horizon WHERE doctor_id = ?', (doctor_id,)).fetchone()
+        first = today
+        if row:
+            first = max(today, datetime.date.fromisoformat(row['generated_until']) + datetime.timedelta(days=1))
+        if first <= last:
+            _generate(conn, doctor_id, first, last)
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+@db.retry_on_locked
+def set_doctor_hours(doctor_id, hours):
+    """Replace a doctor's template with (weekday, start, end, slot_minutes) rows.
+
+    Free future slots are regenerated from the new template; booked
+    slots are kept even if they now fall outside working hours.
+    """
+    today = _today()
+    conn = db.get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DELETE FROM doctor_hours WHERE doctor_id = ?', (doctor_id,))
+        conn.executemany('''
+            INSERT INTO doctor_hours (doctor_id, weekday, start_time, end_time, slot_minutes)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(doctor_id, *row) for row in hours])
+        conn.execute('''
+            DELETE FROM appointment_slots
+            WHERE doctor_id = ? AND slot_date >= ? AND appointment_id IS NULL
+        ''', (doctor_id, today.isoformat()))
+        _generate(conn, doctor_id, today, today + datetime.timedelta(days=SLOT_DAYS))
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def next_free_slots(doctor_id, limit=DEFAULT_FREE_SLOTS, after=None):
+    """The doctor's next free (date, time) slots, earliest first.
+
+    after is a datetime; slots must start later than it (default now).
+    Reads only free slots, through the partial index on appointment_slots.
+    """
+    ensure_slots(doctor_id)
+    after = after or datetime.datetime.now()
+    conn = db.get_db_connection()
+    # The primary key would also match, but would step over every booked
+    # slot of a popular doctor; the partial index holds only free ones
+    rows = conn.execute('''
+        SELECT slot_date, slot_time FROM appointment_slots INDEXED BY idx_appointment_slots_free
+        WHERE doctor_id = ? AND appointment_id IS NULL AND (slot_date, slot_time) > (?, ?)
+        ORDER BY slot_date, slot_time
+        LIMIT ?
+    ''', (doctor_id, after.date().isoformat(), after.strftime('%H:%M'), limit)).fetchall()
+    conn.close()
+    return [(row['slot_date'], row['slot_time']) for row in rows]
+
+@db.retry_on_locked
+def reserve(user_id, doctor_id, slot_date, slot_time, reason):
+    """Book a free slot and create its appointment atomically; returns the appointment id.
+
+    The appointment insert and the claim of the slot commit together or
+    not at all, so two patients racing for the same slot cannot both win.
+    Raises SlotUnavailable if the slot does not exist, is taken or is in
+    the past, or the patient already has an appointment at that time.
+    """
+    if datetime.datetime.fromisoformat(f'{slot_date} {slot_time}') <= datetime.datetime.now():
+        raise SlotUnavailable('That time has already passed.')
+    ensure_slots(doctor_id)
+    conn = db.get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        busy = conn.execute('''
+            SELECT 1 FROM appointments
+            WHERE user_id = ? AND appointment_date = ? AND appointment_time = ? AND status IS NOT 'cancelled'
+        ''', (user_id, slot_date, slot_time)).fetchone()
+        if busy:
+            raise SlotUnavailable('You already have an appointment at that time.')
+        cursor = conn.execute('''
+            INSERT INTO appointments (user_id, doctor_id, appointment_date, appointment_time, reason)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, doctor_id, slot_date, slot_time, reason))
+        appointment_id = cursor.lastrowid
+        # The insert trigger claimed the slot unless it is taken or does not exist
+        claimed = conn.execute('''
+            SELECT 1 FROM appointment_slots
+            WHERE doctor_id = ? AND slot_date = ? AND slot_time = ? AND appointment_id = ?
+        ''', (doctor_id, slot_date, slot_time, appointment_id)).fetchone()
+        if not claimed:
+            raise SlotUnavailable('That slot is no longer available.')
+        conn.commit()
+        return appointment_id
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
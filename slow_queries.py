@@ -0,0 +1,226 @@
+import argparse
+import atexit
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+import database as db
+
+# Statements slower than this many milliseconds are logged
+THRESHOLD_MS = float(os.environ.get('HEALTHCONNECT_SLOW_QUERY_MS', 100))
+
+# Set HEALTHCONNECT_SLOW_QUERY_LOG=0 to stop collecting slow statements
+ENABLED = os.environ.get('HEALTHCONNECT_SLOW_QUERY_LOG', '1') == '1'
+
+# Seconds between writes of the collected statements to slow_queries
+FLUSH_INTERVAL = 10.0
+
+# Statements EXPLAIN QUERY PLAN can describe
+EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'replace', 'with')
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = {}
+_planned = set()
+_flusher = None
+_stop = threading.Event()
+
+def normalize(sql):
+    """Replace literals with ? and collapse whitespace, so similar statements group together"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?, ...)', sql)
+    return ' '.join(sql.split())
+
+def parameter_shape(parameters):
+    """Describe parameter types without keeping their (possibly personal) values"""
+    if parameters is None:
+        return 'executemany'
+    if isinstance(parameters, dict):
+        return ', '.join(f'{name}: {type(value).__name__}' for name, value in parameters.items())
+    return ', '.join(type(value).__name__ for value in parameters)
+
+def explain(conn, sql, parameters):
+    """Return the EXPLAIN QUERY PLAN of sql as indented text, or None"""
+    words = sql.split(None, 1)
+    if not words or words[0].lower() not in EXPLAINABLE:
+        return None
+    # Plans do not depend on the bound values, so NULLs stand in for them
+    if isinstance(parameters, dict):
+        nulls = dict.fromkeys(parameters)
+    else:
+        nulls = [None] * sql.count('?')
+    cursor = conn.cursor(sqlite3.Cursor)
+    try:
+        rows = cursor.execute('EXPLAIN QUERY PLAN ' + sql, nulls).fetchall()
+    except sqlite3.Error as e:
+        return f"(no plan: {e})"
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return '\n'.join(lines)
+
+def observe_statement(sql, parameters, seconds, rows):
+    """Collect a statement that took longer than THRESHOLD_MS"""
+    elapsed_ms = seconds * 1000
+    if not ENABLED or elapsed_ms < THRESHOLD_MS:
+        return
+    key = normalize(sql)
+    with _lock:
+        entry = _pending.get(key)
+        if entry is None:
+            entry = _pending[key] = {'sql': sql, 'parameters': parameters, 'count': 0,
+                                     'total_ms': 0.0, 'max_ms': 0.0, 'max_rows': 0}
+        entry['count'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        entry['max_rows'] = max(entry['max_rows'], rows)
+    logger.warning("Slow query (%.1f ms, %d rows): %s", elapsed_ms, rows, key)
+    _start_flusher()
+
+_installed = False
+
+def install():
+    """Start logging slow statements from this process (idempotent)"""
+    global _installed
+    with _lock:
+        if not _installed:
+            db.add_statement_observer(observe_statement)
+            _installed = True
+
+@db.retry_on_locked
+def _write(conn, rows):
+    cursor = conn.cursor(sqlite3.Cursor)
+    cursor.executemany('''
+        INSERT INTO slow_queries (statement, parameters, count, total_ms, max_ms, max_rows, query_plan)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (statement) DO UPDATE SET
+            parameters = excluded.parameters,
+            count = count + excluded.count,
+            total_ms = total_ms + excluded.total_ms,
+            max_ms = MAX(max_ms, excluded.max_ms),
+            max_rows = MAX(max_rows, excluded.max_rows),
+            query_plan = COALESCE(excluded.query_plan, query_plan),
+            last_seen = CURRENT_TIMESTAMP
+    ''', rows)
+    conn.commit()
+
+def flush():
+    """Write collected statements to the slow_queries table.
+
+    Runs on the flusher thread rather than the slow request, so logging
+    never waits on a write lock held by the statement being logged. The
+    query plan is captured the first time each statement is written.
+    """
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return 0
+    conn = db.get_db_connection()
+    rows = []
+    for key, entry in pending.items():
+        plan = None
+        if key not in _planned:
+            plan = explain(conn, entry['sql'], entry['parameters'])
+            _planned.add(key)
+        rows.append((key, parameter_shape(entry['parameters']), entry['count'], entry['total_ms'],
+                     entry['max_ms'], entry['max_rows'], plan))
+    try:
+        _write(conn, rows)
+    finally:
+        conn.close()
+    return len(rows)
+
+def _run_flusher():
+    while not _stop.wait(FLUSH_INTERVAL):
+        try:
+            flush()
+        except Exception:
+            logger.exception("Slow query flush failed")
+
+def _start_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_run_flusher, name='slow-query-flusher', daemon=True)
+            _flusher.start()
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
+
+def get_slow_queries(order_by='total_ms', limit=20, scans_only=False):
+    """Return logged statements, slowest first by the given column.
+
+    With scans_only, only statements whose plan scans a whole table.
+    """
+    if order_by not in ('total_ms', 'max_ms', 'count', 'mean_ms', 'last_seen'):
+        raise ValueError(f"Cannot sort slow queries by {order_by}")
+    conn = db.get_db_connection()
+    rows = conn.execute(f'''
+        SELECT *, total_ms / count AS mean_ms FROM slow_queries
+        WHERE ? = 0 OR query_plan LIKE 'SCAN %' OR query_plan LIKE '%' || char(10) || '%SCAN %'
+        ORDER BY {order_by} DESC
+        LIMIT ?
+    ''', (1 if scans_only else 0, limit)).fetchall()
+    conn.close()
+    return rows
+
+def reset():
+    """Delete the slow query log"""
+    with _lock:
+        _pending.clear()
+        _planned.clear()
+    conn = db.get_db_connection()
+    conn.execute('DELETE FROM slow_queries')
+    conn.commit()
+    conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show statements from the HealthConnect slow query log')
+    parser.add_argument('--database', default=db.DATABASE, help='SQLite database file')
+    parser.add_argument('--sort', choices=['total_ms', 'max_ms', 'mean_ms', 'count', 'last_seen'],
+                        default='total_ms', help='column to sort by (descending)')
+    parser.add_argument('--limit', '-n', type=int, default=20, help='statements to show')
+    parser.add_argument('--scans', action='store_true', help='only statements whose plan has a full table scan')
+    parser.add_argument('--reset', action='store_true', help='clear the log')
+    args = parser.parse_args(argv)
+
+    db.DATABASE = args.database
+    if args.reset:
+        reset()
+        print("Slow query log cleared.")
+        return
+
+    conn = db.get_db_connection()
+    logged = db._has_table(conn, 'slow_queries')
+    conn.close()
+    rows = get_slow_queries(args.sort, args.limit, args.scans) if logged else []
+
+    print("=" * 80)
+    print("HEALTHCONNECT SLOW QUERIES")
+    print("=" * 80)
+    if not rows:
+        print("No slow queries logged.")
+    for row in rows:
+        print(f"\ncount: {row['count']} | total: {row['total_ms']:.1f} ms | mean: {row['mean_ms']:.1f} ms | "
+              f"max: {row['max_ms']:.1f} ms | max rows: {row['max_rows']} | last: {row['last_seen']}")
+        print(f"   {row['statement']}")
+        if row['parameters']:
+            print(f"   parameters: {row['parameters']}")
+        for line in (row['query_plan'] or '').splitlines():
+            print(f"   {'!' if line.lstrip().startswith('SCAN ') else ' '} {line}")
+
+if __name__ == '__main__':
+    main()
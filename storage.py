@@ -0,0 +1,108 @@
+import hashlib
+import os
+import re
+import tempfile
+from collections import namedtuple
+
+from werkzeug.utils import secure_filename
+
+# Bytes read per chunk when copying uploads that were not streamed to disk
+CHUNK_SIZE = 64 * 1024
+
+# Sub-directory of the upload folder holding in-progress uploads
+TEMP_DIR = 'tmp'
+
+# Result of storing an upload: path relative to the upload folder,
+# content hash, size in bytes and whether identical content already existed
+StoredFile = namedtuple('StoredFile', ['path', 'sha256', 'size', 'duplicate'])
+
+# Prescription file types and the content type each is served with; only
+# these are shown inline, anything else is sent as a download
+PRESCRIPTION_TYPES = {
+    '.pdf': 'application/pdf',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+}
+
+class UnsupportedFileType(ValueError):
+    """Raised when an upload is not one of PRESCRIPTION_TYPES"""
+
+class HashingTempFile:
+    """Temporary upload file that hashes every chunk as it is written.
+
+    Used as the multipart stream factory so request bodies go straight to
+    disk. The file is deleted on close() unless store_upload() kept it.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='upload-', delete=False)
+        self.name = self._file.name
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.kept = False
+
+    def write(self, data):
+        self.hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self.kept and os.path.exists(self.name):
+            os.remove(self.name)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+def content_path(sha256, extension=''):
+    """Sharded location for a content hash: 'ab/cd/abcd....pdf'"""
+    return os.path.join(sha256[:2], sha256[2:4], sha256 + extension)
+
+def content_hash(path):
+    """Return the SHA-256 encoded in a content-addressed path, or None"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem if re.fullmatch(r'[0-9a-f]{64}', stem) else None
+
+def _extension(filename):
+    return os.path.splitext(secure_filename(filename or ''))[1].lower()
+
+def store_upload(file_storage, root):
+    """Move an uploaded file into content-addressed storage under root.
+
+    Identical content is stored once; a duplicate upload only discards
+    its temporary file. Raises UnsupportedFileType unless the file name
+    ends in one of PRESCRIPTION_TYPES, since the stored extension decides
+    how the file is served.
+    """
+    extension = _extension(file_storage.filename)
+    if extension not in PRESCRIPTION_TYPES:
+        if isinstance(file_storage.stream, HashingTempFile):
+            file_storage.stream.close()
+        raise UnsupportedFileType(f"Unsupported file type: {extension or 'none'}")
+    stream = file_storage.stream
+    if not isinstance(stream, HashingTempFile):
+        # Upload was not streamed through HashingTempFile; copy it in chunks
+        copy = HashingTempFile(os.path.join(root, TEMP_DIR))
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            copy.write(chunk)
+        stream = copy
+
+    sha256 = stream.hash.hexdigest()
+    relative_path = content_path(sha256, extension)
+    target = os.path.join(root, relative_path)
+
+    stream.flush()
+    duplicate = os.path.exists(target)
+    if not duplicate:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        stream._file.close()
+        os.replace(stream.name, target)
+        stream.kept = True
+    stream.close()
+    return StoredFile(relative_path.replace(os.sep, '/'), sha256, stream.size, duplicate)
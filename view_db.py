@@ -1,147 +1,266 @@
+import argparse
+import os
 import sqlite3
-from datetime import datetime
+import sys
+import urllib.parse
 
-def view_database():
-    """View all data in the HealthConnect database"""
-    conn = sqlite3.connect('healthconnect.db')
+DATABASE = 'healthconnect.db'
+
+# Rows printed per section unless --limit says otherwise (0 = no limit)
+DEFAULT_LIMIT = 50
+
+# Rows fetched from SQLite at a time
+BATCH_SIZE = 500
+
+def print_user(user):
+    print(f"ID: {user['id']} | Username: {user['username']} | Name: {user['full_name']} | Email: {user['email']}")
+
+def print_doctor(doctor):
+    print(f"ID: {doctor['id']} | Username: {doctor['username']} | Name: {doctor['full_name']}")
+    print(f"   Specialization: {doctor['specialization']} | Experience: {doctor['experience_years']} years")
+    print(f"   Fee: Rs.{doctor['consultation_fee']} | Available: {'Yes' if doctor['available'] else 'No'}")
+    print()
+
+def print_consultation(consult):
+    print(f"Consultation ID: {consult['id']} | Status: {consult['status']}")
+    print(f"   Patient: {consult['fullname']} ({consult['patient_username']}) | Age: {consult['age']} | Gender: {consult['gender']}")
+    print(f"   Doctor: {consult['doctor_name']}")
+    print(f"   Problem: {(consult['problem'] or '')[:100]}...")
+    print(f"   Service: {consult['service_type']} | Date: {(consult['created_at'] or '')[:10]}")
+    if consult['prescription']:
+        print(f"   Prescription: {consult['prescription'][:100]}...")
+    print()
+
+def print_appointment(appt):
+    print(f"Appointment ID: {appt['id']} | Status: {appt['status']}")
+    print(f"   Patient: {appt['patient_name'] or appt['patient_username']}")
+    print(f"   Doctor: {appt['doctor_name']}")
+    print(f"   Date: {appt['appointment_date']} at {appt['appointment_time']}")
+    print(f"   Reason: {appt['reason']}")
+    print()
+
+def print_order(order):
+    print(f"Order ID: {order['id']} | Status: {order['status']}")
+    print(f"   Patient: {order['fullname']} ({order['patient_username']})")
+    print(f"   Phone: {order['phone']}")
+    print(f"   Address: {order['town']}, {order['landmark']}, {order['zipcode']}")
+    print(f"   Prescription File: {order['prescription_file']}")
+    print(f"   Date: {(order['created_at'] or '')[:10]}")
+    print()
+
+def print_message(msg):
+    print(f"Message ID: {msg['id']} | Status: {msg['status']}")
+    print(f"   From: {msg['name']} ({msg['email']})")
+    print(f"   Message: {(msg['message'] or '')[:100]}...")
+    print(f"   Date: {(msg['created_at'] or '')[:10]}")
+    print()
+
+# One entry per report section. 'filters' maps a command line filter to
+# the column it applies to; sections without a column ignore that filter.
+SECTIONS = {
+    'patients': {
+        'title': 'PATIENTS (USERS)',
+        'query': 'SELECT * FROM users u',
+        'filters': {'date': 'u.created_at', 'user': 'u.id'},
+        'order': 'u.id',
+        'print': print_user,
+        'empty': 'No patients registered yet.',
+    },
+    'doctors': {
+        'title': 'DOCTORS',
+        'query': 'SELECT * FROM doctors d',
+        'filters': {'date': 'd.created_at', 'doctor': 'd.id'},
+        'order': 'd.id',
+        'print': print_doctor,
+        'empty': 'No doctors found.',
+    },
+    'consultations': {
+        'title': 'CONSULTATIONS',
+        'query': '''
+            SELECT c.*, d.full_name as doctor_name, u.username as patient_username
+            FROM consultations c
+            LEFT JOIN doctors d ON c.doctor_id = d.id
+            LEFT JOIN users u ON c.user_id = u.id
+        ''',
+        'filters': {'date': 'c.created_at', 'status': 'c.status', 'doctor': 'c.doctor_id', 'user': 'c.user_id'},
+        'order': 'c.created_at DESC',
+        'print': print_consultation,
+        'empty': 'No consultations yet.',
+    },
+    'appointments': {
+        'title': 'APPOINTMENTS',
+        'query': '''
+            SELECT a.*, d.full_name as doctor_name, u.username as patient_username, u.full_name as patient_name
+            FROM appointments a
+            LEFT JOIN doctors d ON a.doctor_id = d.id
+            LEFT JOIN users u ON a.user_id = u.id
+        ''',
+        'filters': {'date': 'a.appointment_date', 'status': 'a.status', 'doctor': 'a.doctor_id',
+                    'user': 'a.user_id'},
+        'order': 'a.appointment_date DESC',
+        'print': print_appointment,
+        'empty': 'No appointments scheduled.',
+    },
+    'orders': {
+        'title': 'MEDICINE ORDERS',
+        'query': '''
+            SELECT m.*, u.username as patient_username
+            FROM medicine_orders m
+            LEFT JOIN users u ON m.user_id = u.id
+        ''',
+        'filters': {'date': 'm.created_at', 'status': 'm.status', 'user': 'm.user_id'},
+        'order': 'm.created_at DESC',
+        'print': print_order,
+        'empty': 'No medicine orders yet.',
+    },
+    'messages': {
+        'title': 'CONTACT MESSAGES',
+        'query': 'SELECT * FROM contact_messages cm',
+        'filters': {'date': 'cm.created_at', 'status': 'cm.status'},
+        'order': 'cm.created_at DESC',
+        'print': print_message,
+        'empty': 'No contact messages yet.',
+    },
+}
+
+def build_query(section, since=None, until=None, status=None, doctor_id=None, user_id=None, limit=None):
+    """Return (sql, params) for one section with the applicable filters"""
+    filters = section['filters']
+    conditions = []
+    params = []
+    if since and 'date' in filters:
+        conditions.append(f"{filters['date']} >= ?")
+        params.append(since)
+    if until and 'date' in filters:
+        # Inclusive end date: everything before the start of the next day
+        conditions.append(f"{filters['date']} < date(?, '+1 day')")
+        params.append(until)
+    for key, value in (('status', status), ('doctor', doctor_id), ('user', user_id)):
+        if value is not None and key in filters:
+            conditions.append(f"{filters[key]} = ?")
+            params.append(value)
+    sql = section['query']
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += f" ORDER BY {section['order']}"
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return sql, params
+
+def stream_rows(conn, sql, params, batch_size=BATCH_SIZE):
+    """Yield rows batch by batch with fetchmany(), never holding the whole result"""
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+# Report names for the tables counted in the stats table
+STATISTICS = {
+    'patients': 'users',
+    'doctors': 'doctors',
+    'consultations': 'consultations',
+    'appointments': 'appointments',
+    'medicine_orders': 'medicine_orders',
+    'contact_messages': 'contact_messages',
+}
+
+def get_statistics(conn):
+    """Row counts for every table.
+
+    Read from the trigger-maintained stats table when the database has
+    one, otherwise counted with one aggregate query.
+    """
+    has_stats = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats'"
+    ).fetchone()
+    if has_stats:
+        totals = dict(conn.execute("SELECT name, value FROM stats WHERE key = ''").fetchall())
+        return {name: totals.get(table, 0) for name, table in STATISTICS.items()}
+    return conn.execute('''
+        SELECT
+            (SELECT COUNT(*) FROM users) AS patients,
+            (SELECT COUNT(*) FROM doctors) AS doctors,
+            (SELECT COUNT(*) FROM consultations) AS consultations,
+            (SELECT COUNT(*) FROM appointments) AS appointments,
+            (SELECT COUNT(*) FROM medicine_orders) AS medicine_orders,
+            (SELECT COUNT(*) FROM contact_messages) AS contact_messages
+    ''').fetchone()
+
+def print_statistics(conn):
+    stats = get_statistics(conn)
+    print(f"Total Patients: {stats['patients']}")
+    print(f"Total Doctors: {stats['doctors']}")
+    print(f"Total Consultations: {stats['consultations']}")
+    print(f"Total Appointments: {stats['appointments']}")
+    print(f"Total Medicine Orders: {stats['medicine_orders']}")
+    print(f"Total Contact Messages: {stats['contact_messages']}")
+
+def view_database(database=DATABASE, sections=None, limit=DEFAULT_LIMIT, since=None, until=None,
+                  status=None, doctor_id=None, user_id=None, statistics=True, batch_size=BATCH_SIZE):
+    """Print a report of the HealthConnect database, streaming each section"""
+    # Read-only, so the report can run against a live production database
+    conn = sqlite3.connect(f'file:{urllib.parse.quote(os.path.abspath(database))}?mode=ro', uri=True)
     conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
 
     print("=" * 80)
     print("HEALTHCONNECT DATABASE VIEWER")
     print("=" * 80)
 
-    # View Users (Patients)
-    print("\n\n[PATIENTS (USERS)]")
-    print("-" * 80)
-    cursor.execute('SELECT * FROM users')
-    users = cursor.fetchall()
-    if users:
-        for user in users:
-            print(f"ID: {user['id']} | Username: {user['username']} | Name: {user['full_name']} | Email: {user['email']}")
-    else:
-        print("No patients registered yet.")
-
-    # View Doctors
-    print("\n\n[DOCTORS]")
-    print("-" * 80)
-    cursor.execute('SELECT * FROM doctors')
-    doctors = cursor.fetchall()
-    if doctors:
-        for doctor in doctors:
-            print(f"ID: {doctor['id']} | Username: {doctor['username']} | Name: {doctor['full_name']}")
-            print(f"   Specialization: {doctor['specialization']} | Experience: {doctor['experience_years']} years")
-            print(f"   Fee: Rs.{doctor['consultation_fee']} | Available: {'Yes' if doctor['available'] else 'No'}")
-            print()
-    else:
-        print("No doctors found.")
-
-    # View Consultations
-    print("\n\n[CONSULTATIONS]")
-    print("-" * 80)
-    cursor.execute('''
-        SELECT c.*, d.full_name as doctor_name, u.username as patient_username
-        FROM consultations c
-        LEFT JOIN doctors d ON c.doctor_id = d.id
-        LEFT JOIN users u ON c.user_id = u.id
-        ORDER BY c.created_at DESC
-    ''')
-    consultations = cursor.fetchall()
-    if consultations:
-        for consult in consultations:
-            print(f"Consultation ID: {consult['id']} | Status: {consult['status']}")
-            print(f"   Patient: {consult['fullname']} ({consult['patient_username']}) | Age: {consult['age']} | Gender: {consult['gender']}")
-            print(f"   Doctor: {consult['doctor_name']}")
-            print(f"   Problem: {consult['problem'][:100]}...")
-            print(f"   Service: {consult['service_type']} | Date: {consult['created_at'][:10]}")
-            if consult['prescription']:
-                print(f"   Prescription: {consult['prescription'][:100]}...")
-            print()
-    else:
-        print("No consultations yet.")
-
-    # View Appointments
-    print("\n\n[APPOINTMENTS]")
-    print("-" * 80)
-    cursor.execute('''
-        SELECT a.*, d.full_name as doctor_name, u.username as patient_username, u.full_name as patient_name
-        FROM appointments a
-        LEFT JOIN doctors d ON a.doctor_id = d.id
-        LEFT JOIN users u ON a.user_id = u.id
-        ORDER BY a.appointment_date DESC
-    ''')
-    appointments = cursor.fetchall()
-    if appointments:
-        for appt in appointments:
-            print(f"Appointment ID: {appt['id']} | Status: {appt['status']}")
-            print(f"   Patient: {appt['patient_name'] or appt['patient_username']}")
-            print(f"   Doctor: {appt['doctor_name']}")
-            print(f"   Date: {appt['appointment_date']} at {appt['appointment_time']}")
-            print(f"   Reason: {appt['reason']}")
-            print()
-    else:
-        print("No appointments scheduled.")
-
-    # View Medicine Orders
-    print("\n\n[MEDICINE ORDERS]")
-    print("-" * 80)
-    cursor.execute('''
-        SELECT m.*, u.username as patient_username
-        FROM medicine_orders m
-        LEFT JOIN users u ON m.user_id = u.id
-        ORDER BY m.created_at DESC
-    ''')
-    orders = cursor.fetchall()
-    if orders:
-        for order in orders:
-            print(f"Order ID: {order['id']} | Status: {order['status']}")
-            print(f"   Patient: {order['fullname']} ({order['patient_username']})")
-            print(f"   Phone: {order['phone']}")
-            print(f"   Address: {order['town']}, {order['landmark']}, {order['zipcode']}")
-            print(f"   Prescription File: {order['prescription_file']}")
-            print(f"   Date: {order['created_at'][:10]}")
-            print()
-    else:
-        print("No medicine orders yet.")
-
-    # View Contact Messages
-    print("\n\n[CONTACT MESSAGES]")
-    print("-" * 80)
-    cursor.execute('SELECT * FROM contact_messages ORDER BY created_at DESC')
-    messages = cursor.fetchall()
-    if messages:
-        for msg in messages:
-            print(f"Message ID: {msg['id']} | Status: {msg['status']}")
-            print(f"   From: {msg['name']} ({msg['email']})")
-            print(f"   Message: {msg['message'][:100]}...")
-            print(f"   Date: {msg['created_at'][:10]}")
-            print()
-    else:
-        print("No contact messages yet.")
-
-    # Statistics
-    print("\n\n[DATABASE STATISTICS]")
-    print("-" * 80)
-    cursor.execute('SELECT COUNT(*) as count FROM users')
-    print(f"Total Patients: {cursor.fetchone()['count']}")
-
-    cursor.execute('SELECT COUNT(*) as count FROM doctors')
-    print(f"Total Doctors: {cursor.fetchone()['count']}")
-
-    cursor.execute('SELECT COUNT(*) as count FROM consultations')
-    print(f"Total Consultations: {cursor.fetchone()['count']}")
-
-    cursor.execute('SELECT COUNT(*) as count FROM appointments')
-    print(f"Total Appointments: {cursor.fetchone()['count']}")
-
-    cursor.execute('SELECT COUNT(*) as count FROM medicine_orders')
-    print(f"Total Medicine Orders: {cursor.fetchone()['count']}")
-
-    cursor.execute('SELECT COUNT(*) as count FROM contact_messages')
-    print(f"Total Contact Messages: {cursor.fetchone()['count']}")
+    for name in SECTIONS if sections is None else sections:
+        section = SECTIONS[name]
+        print(f"\n\n[{section['title']}]")
+        print("-" * 80)
+        sql, params = build_query(section, since, until, status, doctor_id, user_id, limit)
+        count = 0
+        for row in stream_rows(conn, sql, params, batch_size):
+            section['print'](row)
+            count += 1
+        if count == 0:
+            print(section['empty'])
+        elif limit and count == limit:
+            print(f"(first {limit} rows; use --limit 0 for all)")
+
+    if statistics:
+        print("\n\n[DATABASE STATISTICS]")
+        print("-" * 80)
+        print_statistics(conn)
 
     print("\n" + "=" * 80)
     conn.close()
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report on the HealthConnect database')
+    parser.add_argument('sections', nargs='*', metavar='section',
+                        help=f"sections to print (default: all): {', '.join(SECTIONS)}")
+    parser.add_argument('--database', default=DATABASE, help='SQLite database file')
+    parser.add_argument('--limit', '-n', type=int, default=DEFAULT_LIMIT,
+                        help=f'rows per section, 0 for all (default {DEFAULT_LIMIT})')
+    parser.add_argument('--since', metavar='YYYY-MM-DD', help='only rows created (or scheduled) on or after this date')
+    parser.add_argument('--until', metavar='YYYY-MM-DD', help='only rows created (or scheduled) on or before this date')
+    parser.add_argument('--status', help='only rows with this status')
+    parser.add_argument('--doctor-id', type=int, help='only rows for this doctor')
+    parser.add_argument('--user-id', type=int, help='only rows for this patient')
+    parser.add_argument('--stats-only', action='store_true', help='print only the statistics')
+    parser.add_argument('--no-stats', action='store_true', help='skip the statistics')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='rows fetched at a time')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.sections if name not in SECTIONS]
+    if unknown:
+        parser.error(f"unknown section: {', '.join(unknown)}")
+
+    try:
+        view_database(
+            args.database,
+            [] if args.stats_only else args.sections or None,
+            args.limit, args.since, args.until, args.status, args.doctor_id, args.user_id,
+            statistics=not args.no_stats, batch_size=args.batch_size,
+        )
+    except BrokenPipeError:
+        # Output piped into head or less that exited early
+        sys.stderr.close()
+
 if __name__ == '__main__':
-    view_database()
+    main()